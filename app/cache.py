@@ -0,0 +1,269 @@
+# cache.py
+import asyncio
+import hashlib
+import json
+import re
+import time
+import uuid
+from collections import OrderedDict
+
+import orjson
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .env import L1_CACHE_SIZE, L1_CACHE_TTL
+
+SEARCH_CACHE_VERSION = 2
+
+# Fields matched case-insensitively (analyzed text or case_insensitive wildcards in Elasticsearch,
+# categories and maturity spelled as stored by the search builder through the reference data),
+# so folding their case cannot change the result set.
+CASE_INSENSITIVE_FIELDS = ("query", "package_name", "developer_name", "permissions", "categories", "maturity")
+# Comma separated filters whose order carries no meaning
+LIST_FIELDS = ("categories", "maturity", "permissions")
+
+_whitespace = re.compile(r"\s+")
+
+
+def _fold_whitespace(value: str) -> str:
+    return _whitespace.sub(" ", value).strip()
+
+
+def normalize_search_params(params: dict) -> dict:
+    """
+    Canonicalize search parameters so that equivalent requests produce identical params.
+    Text is whitespace folded (and case folded where ES ignores case), list filters are
+    deduplicated and sorted, and empty values collapse to None.
+    """
+    normalized = dict(params)
+    for field, value in params.items():
+        if not isinstance(value, str):
+            continue
+        if field in LIST_FIELDS:
+            items = {_fold_whitespace(item) for item in value.split(",")}
+            if field in CASE_INSENSITIVE_FIELDS:
+                items = {item.lower() for item in items}
+            items.discard("")
+            normalized[field] = ",".join(sorted(items)) or None
+        else:
+            value = _fold_whitespace(value)
+            if field in CASE_INSENSITIVE_FIELDS:
+                value = value.lower()
+            normalized[field] = value or None
+    return normalized
+
+
+def search_fingerprint(params: dict) -> str:
+    """
+    Stable digest of normalized search params. Unlike hash(), this is identical
+    across processes and restarts so every worker shares the same cache entries.
+    """
+    payload = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def search_cache_key(params: dict) -> str:
+    return f"search:v{SEARCH_CACHE_VERSION}:{search_fingerprint(params)}"
+
+
+class CacheStats:
+    """
+    Per-process hit/miss counters for a cache namespace.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        self.hits += 1
+
+    def miss(self):
+        self.misses += 1
+
+    def snapshot(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+search_cache_stats = CacheStats("search")
+
+
+class LocalCache:
+    """
+    Bounded per-process LRU cache with a TTL, sitting in front of Redis for hot keys.
+    Entries are stored as-is, so callers must not mutate returned values.
+    """
+    def __init__(self, name: str, max_size: int = 1024, ttl: float = 60.0):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats(name)
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.miss()
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.stats.miss()
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hit()
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats.snapshot(),
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+details_l1 = LocalCache("details_l1", max_size=L1_CACHE_SIZE, ttl=L1_CACHE_TTL)
+version_details_l1 = LocalCache("version_details_l1", max_size=L1_CACHE_SIZE, ttl=L1_CACHE_TTL)
+suggest_l1 = LocalCache("suggest_l1", max_size=L1_CACHE_SIZE * 4, ttl=L1_CACHE_TTL * 5)  # short prefixes repeat a lot
+
+
+def cache_stats() -> dict:
+    stats = {search_cache_stats.name: search_cache_stats.snapshot()}
+    for local_cache in (details_l1, version_details_l1, suggest_l1):
+        stats[local_cache.name] = local_cache.snapshot()
+    return stats
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent cache misses so only one coroutine per key computes the value
+    while the others await its result. With a redis client, a short lock extends this
+    across processes: losers poll the cache until the winner has filled it.
+    """
+    def __init__(self, lock_timeout_ms: int = 10000, wait_timeout: float = 5.0, poll_interval: float = 0.05):
+        self.lock_timeout_ms = lock_timeout_ms
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._inflight = {}
+
+    async def do(self, key: str, compute, redis_client=None, read_cached=None):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, compute, redis_client, read_cached))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: a disconnecting client must not cancel the computation others are waiting on
+        return await asyncio.shield(task)
+
+    async def _run(self, key, compute, redis_client, read_cached):
+        if redis_client is None or read_cached is None:
+            return await compute()
+
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await redis_client.set(lock_key, token, nx=True, px=self.lock_timeout_ms)
+        except Exception as e:
+            print(e)
+            return await compute()
+
+        if not acquired:
+            # Another process is computing, wait for it to fill the cache
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                cached = await read_cached()
+                if cached is not None:
+                    return cached
+                if not await redis_client.exists(lock_key):
+                    break
+            return await compute()
+
+        try:
+            return await compute()
+        finally:
+            try:
+                await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                print(e)
+
+
+# Delete the lock only if we still own it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+single_flight = SingleFlight()
+
+
+# HTTP revalidation for cacheable read endpoints
+DETAILS_CACHE_CONTROL = "public, max-age=3600"
+REFERENCE_CACHE_CONTROL = "public, max-age=86400"
+SUGGEST_CACHE_CONTROL = "public, max-age=300"
+
+
+def json_body(payload) -> bytes:
+    """
+    Serialize a response payload once, on the miss path. Cache hits reuse these bytes verbatim.
+    """
+    return orjson.dumps(payload)
+
+
+def cache_entry(body) -> tuple:
+    """
+    (body, etag) pair as kept in the L1 caches, so hits neither reparse nor rehash.
+    """
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return body, f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, W/ prefixes are ignored
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def cached_json_response(request: Request, entry: tuple, cache_control: str = None, headers: dict = None) -> Response:
+    """
+    Response for already serialized JSON: 304 when the client holds the same ETag,
+    otherwise the stored bytes as-is, skipping FastAPI validation and serialization.
+    """
+    body, etag = entry
+    headers = {**(headers or {}), "ETag": etag}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
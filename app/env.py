@@ -9,12 +9,30 @@ dbname = os.getenv("DB_NAME")
 DATABASE_URL = f"mysql+pymysql://{user}:{password}@{host}:{port}/{dbname}"
 
 REDIS_URL = os.getenv("REDIS_URL")
+L1_CACHE_SIZE = int(os.getenv("L1_CACHE_SIZE", "2048"))  # entries per endpoint, per process
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", "60"))  # seconds, bounds staleness across workers
+REFERENCE_REFRESH_INTERVAL = float(os.getenv("REFERENCE_REFRESH_INTERVAL", "600"))  # seconds between category reloads
+
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "10"))  # seconds between MySQL/Redis/ES health checks
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))  # threads per process for password hashing
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "32"))  # running + queued hashes before login/register answer 503
+RATE_LIMITS = os.getenv("RATE_LIMITS")  # JSON policies per route, see rate_limit.py
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))  # download_logs rows per multi-row insert
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1"))  # seconds, upper bound on how long a row waits
+LOG_MAX_BUFFERED = int(os.getenv("LOG_MAX_BUFFERED", "50000"))  # rows kept in memory while MySQL is unreachable
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}  # users allowed on /api/admin routes
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))  # seconds a user's permissions are cached, bounds staleness of direct DB edits
 
 ELASTICSEARCH_URL = f'https://{host}:9200'
 ELASTIC_USER = os.getenv("ES_USER")
 ELASTIC_PASSWORD = os.getenv("ES_PASSWORD")
-INDEX = os.getenv("ES_INDEX")
-ES_CA_CERTS = os.getenv("ELASTIC_CA_CERT_PATH")
\ No newline at end of file
+INDEX = os.getenv("ES_INDEX")  # read alias, swapped by reindex.py
+ES_MAPPING_VERSION = os.getenv("ES_MAPPING_VERSION")
+ES_CA_CERTS = os.getenv("ELASTIC_CA_CERT_PATH")
+
+APK_INDEX_PATH = os.getenv("APK_INDEX_PATH", "apk_index.sqlite3")
+APK_INDEX_AUTHORITATIVE = os.getenv("APK_INDEX_AUTHORITATIVE", "false").lower() == "true"  # reject hashes missing from the index without probing the volume
\ No newline at end of file
@@ -0,0 +1,325 @@
+# file_index.py
+# Hash -> base directory index for APK files, so locating a file never probes the
+# (network mounted) APK volume. The index is a local SQLite file shared by all
+# workers, built by a scanner and refreshed incrementally:
+#
+#   python -m app.file_index --scan       walk every base directory (full rebuild)
+#   python -m app.file_index --refresh    check only hashes downloaded since the last refresh
+import argparse
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from .env import APK_INDEX_PATH, APK_INDEX_AUTHORITATIVE
+
+# Base directories to search for the file
+ALLOWED_BASE_DIRS = [
+    "/Volumes/apks",
+    "/Volumes/apks/2018",
+    "/Volumes/apks/old_apks"
+]
+SHARD_DEPTH = 6
+BLOOM_BITS_PER_ITEM = 10
+BLOOM_HASHES = 7
+RELOAD_INTERVAL = 60  # seconds between checks for a new scan/refresh generation
+
+
+def sanitize_file_path(hash_value: str) -> str:
+    """
+    Sanitize the hash_value to ensure it cannot traverse directories.
+    """
+    return os.path.basename(hash_value)  # Ensure only the base name is used
+
+
+def validate_file_path(file_path: str) -> bool:
+    """
+    Ensure the file path is within the allowed base directories.
+    """
+    for base_dir in ALLOWED_BASE_DIRS:
+        if os.path.commonpath([base_dir, file_path]) == base_dir:
+            return True
+    return False
+
+
+def sharded_path(base_dir: str, hash_value: str) -> str:
+    """
+    Files live under one directory level per leading character of their hash.
+    """
+    return os.path.join(base_dir, *hash_value[:SHARD_DEPTH], hash_value)
+
+
+def probe_file_path(hash_value: str):
+    """
+    Look for the file on the volume itself. Returns (base_dir, file_path) or None.
+    """
+    for base_dir in ALLOWED_BASE_DIRS:
+        file_path = sharded_path(base_dir, hash_value)
+        if validate_file_path(file_path) and os.path.exists(file_path):
+            return base_dir, file_path
+    return None
+
+
+class BloomFilter:
+    """
+    Compact set membership with no false negatives, used to reject unknown hashes in memory.
+    """
+    def __init__(self, capacity: int):
+        self.size = max(capacity * BLOOM_BITS_PER_ITEM, 1024)
+        self.bits = bytearray(self.size // 8 + 1)
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(BLOOM_HASHES))
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class FileIndex:
+    def __init__(self, path: str, authoritative: bool = False):
+        self.path = path
+        self.authoritative = authoritative
+        self._conn = None
+        self._base_dirs = {}
+        self._bloom = None
+        self._generation = None
+        self._lock = threading.Lock()  # lookups run in worker threads and share one connection
+
+    def connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS base_dir (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS apk_location (hash TEXT PRIMARY KEY, base_dir_id INTEGER NOT NULL) WITHOUT ROWID")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.commit()
+        return self._conn
+
+    def base_dir_id(self, base_dir: str) -> int:
+        conn = self.connect()
+        conn.execute("INSERT OR IGNORE INTO base_dir (path) VALUES (?)", (base_dir,))
+        return conn.execute("SELECT id FROM base_dir WHERE path = ?", (base_dir,)).fetchone()[0]
+
+    def generation(self):
+        return self.get_meta("generation")
+
+    def bump_generation(self):
+        self.set_meta("generation", str(time.time()))
+
+    def load(self):
+        """
+        Load base directories and build the Bloom filter. Blocking, run it off the event loop.
+        """
+        if not os.path.exists(self.path):
+            return
+        self.connect()  # make sure the schema exists
+        # Own connection: this runs in a worker thread while lookups use the shared one
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+            generation = row[0] if row else None
+            base_dirs = {row[0]: row[1] for row in conn.execute("SELECT id, path FROM base_dir")}
+            count = conn.execute("SELECT COUNT(*) FROM apk_location").fetchone()[0]
+            bloom = BloomFilter(count)
+            for (hash_value,) in conn.execute("SELECT hash FROM apk_location"):
+                bloom.add(hash_value)
+        finally:
+            conn.close()
+        self._base_dirs = base_dirs
+        self._bloom = bloom
+        self._generation = generation
+        print(f"Loaded file index: {count} files")
+
+    async def keep_loaded(self, interval: float = RELOAD_INTERVAL):
+        """
+        Background task: (re)build the in-memory filter whenever a scan or refresh bumped the generation.
+        """
+        while True:
+            try:
+                if os.path.exists(self.path) and (self._bloom is None or await asyncio.to_thread(self.generation) != self._generation):
+                    # Until the new filter is ready lookups go straight to SQLite
+                    self._bloom = None
+                    await asyncio.to_thread(self.load)
+            except Exception as e:
+                print(f"File index reload failed: {e}")
+            await asyncio.sleep(interval)
+
+    def add(self, hash_value: str, base_dir: str):
+        with self._lock:
+            conn = self.connect()
+            conn.execute("INSERT OR REPLACE INTO apk_location (hash, base_dir_id) VALUES (?, ?)", (hash_value, self.base_dir_id(base_dir)))
+            conn.commit()
+        if self._bloom is not None:
+            self._bloom.add(hash_value)
+
+    def rejects(self, hash_value: str) -> bool:
+        """
+        True when the in-memory filter knows the hash is not indexed.
+        """
+        return self._bloom is not None and hash_value not in self._bloom
+
+    def lookup(self, hash_value: str):
+        """
+        Indexed path for a hash, None when the index does not know it.
+        """
+        if self.rejects(hash_value):
+            return None
+        if not os.path.exists(self.path):
+            return None
+        with self._lock:
+            row = self.connect().execute("SELECT base_dir_id FROM apk_location WHERE hash = ?", (hash_value,)).fetchone()
+            if row is None:
+                return None
+            if row[0] not in self._base_dirs:
+                self._base_dirs = {row[0]: row[1] for row in self.connect().execute("SELECT id, path FROM base_dir")}
+        base_dir = self._base_dirs.get(row[0])
+        return sharded_path(base_dir, hash_value) if base_dir else None
+
+    def locate(self, hash_value: str) -> str:
+        """
+        Path of the file for a hash. Indexed hashes never touch the volume; unknown hashes
+        are rejected outright when the index is authoritative, otherwise probed and recorded.
+        """
+        sanitized_hash = sanitize_file_path(hash_value)
+        file_path = self.lookup(sanitized_hash)
+        if file_path is not None and validate_file_path(file_path):
+            return file_path
+        if self.authoritative and self._bloom is not None:
+            raise FileNotFoundError("File not found.")
+
+        found = probe_file_path(sanitized_hash)
+        if found is None:
+            raise FileNotFoundError("File not found.")
+        base_dir, file_path = found
+        try:
+            self.add(sanitized_hash, base_dir)
+        except sqlite3.Error as e:
+            print(f"Could not record {sanitized_hash} in the file index: {e}")
+        return file_path
+
+    def scan(self) -> int:
+        """
+        Full rebuild from the sharded directory trees.
+        """
+        conn = self.connect()
+        start_time = time.time()
+        total = 0
+        conn.execute("DELETE FROM apk_location")
+        for base_dir in ALLOWED_BASE_DIRS:
+            base_dir_id = self.base_dir_id(base_dir)
+            batch = []
+            for hash_value in walk_shards(base_dir):
+                batch.append((hash_value, base_dir_id))
+                if len(batch) >= 10000:
+                    conn.executemany("INSERT OR IGNORE INTO apk_location (hash, base_dir_id) VALUES (?, ?)", batch)
+                    total += len(batch)
+                    batch = []
+                    print(f"Scanned {total} files ({total / (time.time() - start_time):.0f} files/sec)")
+            conn.executemany("INSERT OR IGNORE INTO apk_location (hash, base_dir_id) VALUES (?, ?)", batch)
+            total += len(batch)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scanned_on', ?)", (datetime.utcnow().isoformat(),))
+        conn.commit()
+        self.bump_generation()
+        print(f"Indexed {total} files in {time.time() - start_time:.2f}s")
+        return total
+
+    def get_meta(self, key: str):
+        row = self.connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        conn = self.connect()
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        conn.commit()
+
+
+def walk_shards(base_dir: str, depth: int = 0, prefix: str = ""):
+    """
+    Yield the hashes stored under a sharded tree. Only single character directories
+    are shards, which skips nested base directories such as /Volumes/apks/2018.
+    """
+    try:
+        entries = list(os.scandir(os.path.join(base_dir, *prefix)))
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return
+    for entry in entries:
+        if depth < SHARD_DEPTH:
+            if len(entry.name) == 1 and entry.is_dir(follow_symlinks=False):
+                yield from walk_shards(base_dir, depth + 1, prefix + entry.name)
+        elif entry.is_file() and entry.name.startswith(prefix):
+            yield entry.name
+
+
+file_index = FileIndex(APK_INDEX_PATH, APK_INDEX_AUTHORITATIVE)
+
+
+async def find_file_path(hash_value: str) -> str:
+    """
+    Search for the file in the allowed directories and validate the path. Hashes the
+    authoritative index rejects are answered in memory, SQLite lookups and volume
+    probes run in a worker thread so they never block the event loop.
+    """
+    if file_index.authoritative and file_index.rejects(sanitize_file_path(hash_value)):
+        raise FileNotFoundError("File not found.")
+    return await asyncio.to_thread(file_index.locate, hash_value)
+
+
+async def refresh_from_downloads(index: FileIndex) -> int:
+    """
+    Incremental refresh: probe only hashes of downloads created since the last refresh.
+    """
+    from sqlalchemy import select, func
+    from .config import connect, disconnect, get_database
+    from .models import model_download
+
+    since = index.get_meta("refreshed_on") or index.get_meta("scanned_on")
+    await connect()
+    try:
+        database = get_database()
+        upper = await database.fetch_val(select(func.max(model_download.c.created_on)))
+        query = select(model_download.c.hash).distinct()
+        if since:
+            query = query.where(model_download.c.created_on >= datetime.fromisoformat(since))
+        hashes = [row["hash"] for row in await database.fetch_all(query) if row["hash"]]
+    finally:
+        await disconnect()
+
+    found = 0
+    for hash_value in hashes:
+        location = probe_file_path(sanitize_file_path(hash_value))
+        if location is not None:
+            index.add(sanitize_file_path(hash_value), location[0])
+            found += 1
+    if upper is not None:
+        index.set_meta("refreshed_on", upper.isoformat())
+    if found:
+        index.bump_generation()
+    print(f"Checked {len(hashes)} new hashes, {found} present on disk")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the APK hash -> location index")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--scan", action="store_true", help="rebuild the index by walking every base directory")
+    mode.add_argument("--refresh", action="store_true", help="add files for downloads created since the last refresh")
+    args = parser.parse_args()
+
+    if args.scan:
+        file_index.scan()
+    else:
+        asyncio.run(refresh_from_downloads(file_index))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# file_serving.py
+# APK file responses with Content-Length and single/multi Range support (206).
+# Bodies go out through ASGI extensions that let the server send the file itself:
+# http.response.pathsend for full responses (offered by Granian) and
+# http.response.zerocopy (sendfile) for ranges. uvicorn, which this app runs under,
+# offers neither, so there every byte goes through large reads in the anyio thread pool.
+import os
+import stat
+import secrets
+from email.utils import formatdate
+
+import anyio
+from starlette.responses import Response
+
+CHUNK_SIZE = 1024 * 1024
+MAX_RANGES = 16  # more than this is treated as abuse and served as a full response
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(range_header: str, file_size: int):
+    """
+    Parse a bytes Range header into sorted, merged (start, end) inclusive ranges.
+    Returns None when the header should be ignored (missing, malformed, not bytes).
+    Raises RangeNotSatisfiable when no range overlaps the file.
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        start, sep, end = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start == "":
+                # Suffix range: last N bytes
+                length = int(end)
+                if length == 0:
+                    continue
+                ranges.append((max(file_size - length, 0), file_size - 1))
+            else:
+                start = int(start)
+                end = int(end) if end else file_size - 1
+                if start >= file_size:
+                    continue
+                if end < start:
+                    return None
+                ranges.append((start, min(end, file_size - 1)))
+        except ValueError:
+            return None
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class RangeFileResponse(Response):
+    """
+    Serve a file honouring the request's Range header.
+    """
+    def __init__(self, path: str, range_header: str = None, filename: str = None, media_type: str = "application/octet-stream", headers: dict = None):
+        super().__init__(status_code=200, headers=headers, media_type=media_type)
+        self.path = path
+        self.range_header = range_header
+        self.filename = filename
+
+    async def __call__(self, scope, receive, send):
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        except FileNotFoundError:
+            await Response("File not found.", status_code=404)(scope, receive, send)
+            return
+        if not stat.S_ISREG(stat_result.st_mode):
+            await Response("File not found.", status_code=404)(scope, receive, send)
+            return
+
+        file_size = stat_result.st_size
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["last-modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+        if self.filename:
+            self.headers["content-disposition"] = f'attachment; filename="{self.filename}"'
+
+        try:
+            ranges = parse_range_header(self.range_header, file_size)
+        except RangeNotSatisfiable:
+            await Response(status_code=416, headers={"content-range": f"bytes */{file_size}"})(scope, receive, send)
+            return
+
+        if ranges is None:
+            await self.send_full(scope, send, file_size)
+        elif len(ranges) == 1:
+            await self.send_single_range(scope, send, file_size, *ranges[0])
+        else:
+            await self.send_multi_range(scope, send, file_size, ranges)
+
+    async def send_full(self, scope, send, file_size):
+        self.headers["content-length"] = str(file_size)
+        await send({"type": "http.response.start", "status": 200, "headers": self.raw_headers})
+        if file_size and "http.response.pathsend" in scope.get("extensions", {}):
+            # The server streams the whole file itself
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            return
+        await self.send_file_ranges(scope, send, [(0, file_size - 1)] if file_size else [])
+
+    async def send_single_range(self, scope, send, file_size, start, end):
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        await self.send_file_ranges(scope, send, [(start, end)])
+
+    async def send_multi_range(self, scope, send, file_size, ranges):
+        boundary = secrets.token_hex(16)
+        part_headers = [
+            (
+                f"--{boundary}\r\n"
+                f"Content-Type: {self.media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        closing = f"--{boundary}--\r\n".encode("latin-1")
+        content_length = sum(len(header) + (end - start + 1) + 2 for header, (start, end) in zip(part_headers, ranges)) + len(closing)
+
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(content_length)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+
+        for header, byte_range in zip(part_headers, ranges):
+            await send({"type": "http.response.body", "body": header, "more_body": True})
+            await self.send_file_ranges(scope, send, [byte_range], more_body=True)
+            await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+    async def send_file_ranges(self, scope, send, ranges, more_body=False):
+        if not ranges:
+            await send({"type": "http.response.body", "body": b"", "more_body": more_body})
+            return
+
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            # Let the server sendfile() straight from the page cache
+            f = await anyio.to_thread.run_sync(open, self.path, "rb")
+            try:
+                for i, (start, end) in enumerate(ranges):
+                    await send({
+                        "type": "http.response.zerocopy",
+                        "file": f,
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": more_body or i < len(ranges) - 1,
+                    })
+            finally:
+                f.close()
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            for start, end in ranges:
+                await f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break  # file shrank underneath us
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        if not more_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
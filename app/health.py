@@ -0,0 +1,148 @@
+# health.py
+# Background health supervisor for MySQL, Redis and Elasticsearch. Every dependency is
+# checked on an interval and reconnected proactively when checks keep failing with errors,
+# so requests no longer pay a round trip to find out. HealthGateMiddleware reads the
+# recorded state and fails fast only while a dependency a route needs is known to be down.
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from . import config
+from .env import HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT
+
+RECOVERY_INTERVAL = 2  # seconds between checks while a dependency is down
+MYSQL_RECONNECT_AFTER = 3  # rebuilding the shared pool drops every connection, only do it once errors persist
+
+
+class Dependency:
+    def __init__(self, name: str, check, reconnect, reconnect_after: int = 1):
+        self.name = name
+        self.check = check
+        self.reconnect = reconnect
+        self.reconnect_after = reconnect_after  # consecutive failed checks before reconnecting
+        self.healthy = True  # the lifespan connected everything before the supervisor starts
+        self.failures = 0
+        self.last_error = None
+        self.checked_on = None
+
+    def snapshot(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "checked_on": self.checked_on,
+        }
+
+
+class HealthSupervisor:
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.dependencies = {}
+
+    def register(self, name: str, check, reconnect, reconnect_after: int = 1):
+        self.dependencies[name] = Dependency(name, check, reconnect, reconnect_after)
+
+    def down(self, names) -> list:
+        """
+        Names of the given dependencies currently known to be down.
+        """
+        return [name for name in names if not self.dependencies[name].healthy]
+
+    def record_failure(self, dependency: Dependency, error: str):
+        if dependency.healthy:
+            print(f"{dependency.name} is down: {error}")
+        dependency.healthy = False
+        dependency.failures += 1
+        dependency.last_error = error
+        dependency.checked_on = time.time()
+
+    def record_success(self, dependency: Dependency):
+        if not dependency.healthy:
+            print(f"{dependency.name} is back up after {dependency.failures} failed checks")
+        dependency.healthy = True
+        dependency.failures = 0
+        dependency.checked_on = time.time()
+
+    async def probe(self, dependency: Dependency):
+        """
+        Check a dependency. A timeout only marks it down: a saturated pool is slow, not broken,
+        and tearing it down would turn slowness into an outage. Errors reconnect once
+        reconnect_after checks in a row have failed, then check again.
+        """
+        try:
+            await asyncio.wait_for(dependency.check(), self.timeout)
+        except asyncio.TimeoutError:
+            self.record_failure(dependency, f"check timed out after {self.timeout}s")
+            return
+        except Exception as e:
+            self.record_failure(dependency, repr(e))
+            if dependency.failures < dependency.reconnect_after:
+                return
+            print(f"{dependency.name} failed {dependency.failures} checks in a row, reconnecting")
+            try:
+                await asyncio.wait_for(dependency.reconnect(), self.timeout * 2)
+                await asyncio.wait_for(dependency.check(), self.timeout)
+            except Exception as e:
+                dependency.last_error = repr(e)
+                return
+        self.record_success(dependency)
+
+    async def check_all(self):
+        await asyncio.gather(*(self.probe(dependency) for dependency in self.dependencies.values()))
+
+    async def run(self):
+        """
+        Background task started by the lifespan.
+        """
+        while True:
+            try:
+                await self.check_all()
+            except Exception as e:
+                print(f"Health supervisor error: {e!r}")
+            any_down = any(not dependency.healthy for dependency in self.dependencies.values())
+            await asyncio.sleep(RECOVERY_INTERVAL if any_down else self.interval)
+
+    def snapshot(self) -> dict:
+        return {name: dependency.snapshot() for name, dependency in self.dependencies.items()}
+
+
+async def check_mysql():
+    await config.database.execute(text("SELECT 1"))
+
+
+async def reconnect_mysql():
+    if config.database.is_connected:
+        await config.database.disconnect()
+    await config.database.connect()
+
+
+async def check_redis():
+    await config.get_redis().ping()
+
+
+async def reconnect_redis():
+    # Drop idle sockets only, commands in flight keep theirs; the pool reconnects lazily
+    await config.get_redis().connection_pool.disconnect(inuse_connections=False)
+
+
+async def check_elastic():
+    if not await config.get_elasticsearch_async().ping():
+        raise ConnectionError("Elasticsearch ping failed")
+
+
+async def reconnect_elastic():
+    # Requests in flight hold the old client, close it only once the new one is in place
+    old_client = config.get_elasticsearch_async()
+    try:
+        await config.connect_elastic()
+    finally:
+        if config.get_elasticsearch_async() is not old_client:
+            await old_client.close()
+
+
+health_supervisor = HealthSupervisor()
+health_supervisor.register("mysql", check_mysql, reconnect_mysql, MYSQL_RECONNECT_AFTER)
+health_supervisor.register("redis", check_redis, reconnect_redis)
+health_supervisor.register("elasticsearch", check_elastic, reconnect_elastic)
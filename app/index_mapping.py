@@ -0,0 +1,100 @@
+# index_mapping.py
+# Versioned Elasticsearch mapping for the apps index. Bump MAPPING_VERSION whenever
+# the mapping changes in a way the search builder depends on, and reindex.
+
+MAPPING_VERSION = 3
+
+# Substring matching goes through trigram subfields: a match_phrase over consecutive
+# trigrams is an exact substring match resolved from the terms index, unlike a
+# leading wildcard which has to scan the whole terms dictionary.
+NGRAM_SIZE = 3
+
+INDEX_SETTINGS = {
+    "analysis": {
+        "tokenizer": {
+            "trigram": {
+                "type": "ngram",
+                "min_gram": NGRAM_SIZE,
+                "max_gram": NGRAM_SIZE,
+                "token_chars": []  # keep dots, underscores and digits inside grams
+            }
+        },
+        "analyzer": {
+            "trigram": {
+                "type": "custom",
+                "tokenizer": "trigram",
+                "filter": ["lowercase"]
+            },
+            # Unlike the default "simple" analyzer keeps digits and dots ("2048", "com.example")
+            "suggest": {
+                "type": "custom",
+                "tokenizer": "whitespace",
+                "filter": ["lowercase", "asciifolding"]
+            }
+        }
+    }
+}
+
+NGRAM_SUBFIELD = {"type": "text", "analyzer": "trigram"}
+
+MAPPINGS = {
+    "_meta": {"mapping_version": MAPPING_VERSION},
+    "properties": {
+        "app_id": {"type": "keyword"},
+        "package_name": {
+            "type": "text",
+            "fields": {
+                "raw": {"type": "keyword"},
+                "ngram": NGRAM_SUBFIELD
+            }
+        },
+        "developer_name": {"type": "text"},
+        "latest_name": {"type": "keyword", "index": False},
+        # Autocomplete on latest name and package name (v3), an in-memory FST answering prefix lookups
+        "suggest": {"type": "completion", "analyzer": "suggest"},
+        "categories": {"type": "keyword"},
+        "names": {
+            "type": "nested",
+            "properties": {
+                "name": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+                "created_on": {"type": "date"}
+            }
+        },
+        "descriptions": {
+            "type": "nested",
+            "properties": {
+                "description": {"type": "text"},
+                "created_on": {"type": "date"}
+            }
+        },
+        "versions": {
+            "type": "nested",
+            "properties": {
+                "id": {"type": "keyword"},
+                "permissions": {
+                    "type": "text",
+                    "fields": {
+                        "raw": {"type": "keyword"},
+                        "ngram": NGRAM_SUBFIELD
+                    }
+                }
+            }
+        }
+    }
+}
+
+
+def index_body(settings: dict = None) -> dict:
+    """
+    Create-index body for the current mapping version, with optional extra index settings.
+    """
+    return {
+        "settings": {**INDEX_SETTINGS, **(settings or {})},
+        "mappings": MAPPINGS
+    }
+
+
+async def create_index(es_client, index_name: str, settings: dict = None):
+    await es_client.indices.create(index=index_name, body=index_body(settings))
+    print(f"Created index: {index_name} (mapping v{MAPPING_VERSION})")
+    return index_name
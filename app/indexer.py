@@ -0,0 +1,286 @@
+# indexer.py
+# Bulk MySQL -> Elasticsearch indexer, run as a standalone command:
+#
+#   python -m app.indexer --index apps-v2 --create --workers 10
+#   python -m app.indexer --index apps-v2 --resume        # continue a crashed run
+#
+# A producer pages model_app by primary key (keyset, no OFFSET) and hands id batches
+# to the workers. The checkpoint records the highest app id below which every batch
+# has been indexed, so a resumed run never skips or re-reads more than one window.
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from elasticsearch import helpers
+from sqlalchemy import select
+
+from .config import connect, disconnect, connect_elastic, close_elastic, get_database, get_elasticsearch_async
+from .models import model_app, model_developer, model_name, model_description, model_category
+from .models import model_category_apps__model_app_categories, model_download, model_androidmanifest
+from .models import model_app_permissions, model_permissionrequested
+from .index_mapping import create_index
+from .search import latest_name, suggest_input
+
+BATCH_SIZE = 1000
+NUM_WORKERS = 10
+
+
+def format_date(value):
+    return value.strftime("%Y-%m-%d") if value else None
+
+
+async def build_documents(database, app_ids: list) -> dict:
+    """
+    Search documents for a batch of apps keyed by app id, built from one keyed
+    query per table so no join multiplies the rows.
+    """
+    apps_query = (
+        select(model_app.c.id, model_app.c.app_id.label("package_name"), model_developer.c.developer_id.label("developer_name"))
+        .select_from(model_app.join(model_developer, model_app.c.developer_id == model_developer.c.id))
+        .where(model_app.c.id.in_(app_ids))
+    )
+    app_data = {
+        row["id"]: {
+            "package_name": row["package_name"],
+            "developer_name": row["developer_name"],
+            "names": set(),
+            "descriptions": set(),
+            "categories": set(),
+            "versions": {}
+        }
+        for row in await database.fetch_all(apps_query)
+    }
+    if not app_data:
+        return {}
+    app_ids = list(app_data)
+
+    names_query = select(model_name.c.app_id, model_name.c.name, model_name.c.created_on).where(model_name.c.app_id.in_(app_ids))
+    for row in await database.fetch_all(names_query):
+        if row["name"]:
+            app_data[row["app_id"]]["names"].add((row["name"], format_date(row["created_on"])))
+
+    descriptions_query = select(model_description.c.app_id, model_description.c.text, model_description.c.created_on).where(model_description.c.app_id.in_(app_ids))
+    for row in await database.fetch_all(descriptions_query):
+        if row["text"]:
+            app_data[row["app_id"]]["descriptions"].add((row["text"], format_date(row["created_on"])))
+
+    mca = model_category_apps__model_app_categories
+    categories_query = (
+        select(mca.c.model_app_id, model_category.c.name)
+        .select_from(mca.join(model_category, mca.c.model_category_id == model_category.c.id))
+        .where(mca.c.model_app_id.in_(app_ids))
+    )
+    for row in await database.fetch_all(categories_query):
+        if row["name"]:
+            app_data[row["model_app_id"]]["categories"].add(row["name"])
+
+    # Versions and the permissions requested by each of their downloads
+    downloads_query = select(model_download.c.id, model_download.c.app_id, model_download.c.version_id).where(model_download.c.app_id.in_(app_ids))
+    downloads = {}
+    for row in await database.fetch_all(downloads_query):
+        downloads[row["id"]] = (row["app_id"], row["version_id"])
+        app_data[row["app_id"]]["versions"].setdefault(row["version_id"], set())
+
+    if downloads:
+        download_ids = list(downloads)
+        permissions_queries = (
+            select(model_app_permissions.c.download_id, model_app_permissions.c.name)
+            .where(model_app_permissions.c.download_id.in_(download_ids))
+            .distinct(),
+            select(model_androidmanifest.c.download_id, model_permissionrequested.c.name)
+            .select_from(model_androidmanifest.join(model_permissionrequested, model_androidmanifest.c.id == model_permissionrequested.c.manifest_id))
+            .where(model_androidmanifest.c.download_id.in_(download_ids))
+            .distinct(),
+        )
+        for query in permissions_queries:
+            for row in await database.fetch_all(query):
+                if row["name"]:
+                    app_id, version_id = downloads[row["download_id"]]
+                    app_data[app_id]["versions"][version_id].add(row["name"])
+
+    documents = {}
+    for app_id, data in app_data.items():
+        names = [{"name": name, "created_on": date} for name, date in data["names"]]
+        versions = [{"id": version_id, "permissions": list(permissions)} for version_id, permissions in data["versions"].items()]
+        documents[app_id] = {
+            "app_id": app_id,
+            "package_name": data["package_name"],
+            "developer_name": data["developer_name"],
+            "names": names,
+            "latest_name": latest_name(names),
+            "descriptions": [{"description": description, "created_on": date} for description, date in data["descriptions"]],
+            "categories": list(data["categories"]),
+            "versions": versions,
+            "suggest": suggest_input(latest_name(names), data["package_name"], len(versions))
+        }
+    return documents
+
+
+async def retry_async_bulk(es_client, actions, worker_id, max_retries=3):
+    """
+    Retryable async_bulk helper for Elasticsearch.
+
+    Returns:
+        (success, failed): A tuple of successful and failed counts.
+    """
+    for attempt in range(1, max_retries + 1):
+        try:
+            success, errors = await helpers.async_bulk(es_client, actions, raise_on_error=False)
+            return success, len(errors)
+        except Exception as e:
+            if attempt == max_retries:
+                print(f"Worker {worker_id}: bulk op failed after {attempt} attempts: {e}")
+                raise
+            print(f"Worker {worker_id}: retrying bulk op (attempt {attempt + 1}) due to error: {e}")
+            await asyncio.sleep(2 ** attempt)
+
+
+async def index_apps(database, es_client, index_name: str, app_ids: list, worker_id=0):
+    """
+    Build and bulk index the documents of the given apps. Returns (success, failed).
+    """
+    documents = await build_documents(database, app_ids)
+    if not documents:
+        return 0, 0
+    actions = [
+        {"_op_type": "index", "_index": index_name, "_id": app_id, "_source": document}
+        for app_id, document in documents.items()
+    ]
+    return await retry_async_bulk(es_client, actions, worker_id)
+
+
+class Checkpoint:
+    """
+    Resumable progress stored as JSON next to the run. Batches finish out of order,
+    so only the contiguous prefix of completed batches advances last_id.
+    """
+    def __init__(self, path: str, index_name: str):
+        self.path = path
+        self.index_name = index_name
+        self.last_id = 0
+        self.indexed = 0
+        self.failed = 0
+        self._pending = {}  # batch start id -> (batch end id, completed)
+        self._order = []
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get("index") != self.index_name:
+            raise ValueError(f"Checkpoint {self.path} belongs to index {state.get('index')}")
+        self.last_id = state["last_id"]
+        self.indexed = state.get("indexed", 0)
+        self.failed = state.get("failed", 0)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"index": self.index_name, "last_id": self.last_id, "indexed": self.indexed, "failed": self.failed}, f)
+        os.replace(tmp_path, self.path)  # atomic, a crash never leaves a torn checkpoint
+
+    def started(self, first_id: int, last_id: int):
+        self._pending[first_id] = [last_id, False]
+        self._order.append(first_id)
+
+    def completed(self, first_id: int, success: int, failed: int):
+        self._pending[first_id][1] = True
+        self.indexed += success
+        self.failed += failed
+        while self._order and self._pending[self._order[0]][1]:
+            self.last_id = self._pending.pop(self._order.pop(0))[0]
+        self.save()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def produce_batches(database, queue: asyncio.Queue, checkpoint: Checkpoint, batch_size: int, num_workers: int):
+    last_id = checkpoint.last_id
+    while True:
+        ids_query = select(model_app.c.id).where(model_app.c.id > last_id).order_by(model_app.c.id).limit(batch_size)
+        app_ids = [row["id"] for row in await database.fetch_all(ids_query)]
+        if not app_ids:
+            break
+        checkpoint.started(app_ids[0], app_ids[-1])
+        await queue.put(app_ids)
+        last_id = app_ids[-1]
+    for _ in range(num_workers):
+        await queue.put(None)
+
+
+async def worker(worker_id, database, es_client, index_name, queue: asyncio.Queue, checkpoint: Checkpoint, stats: dict):
+    while True:
+        app_ids = await queue.get()
+        if app_ids is None:
+            return
+        batch_start_time = time.time()
+        success, failed = await index_apps(database, es_client, index_name, app_ids, worker_id)
+        checkpoint.completed(app_ids[0], success, failed)
+
+        stats["docs"] += success
+        elapsed = time.time() - stats["start_time"]
+        print(f"Worker {worker_id}: apps {app_ids[0]}-{app_ids[-1]} in {time.time() - batch_start_time:.2f}s, "
+              f"success: {success}, failed: {failed}, "
+              f"total: {checkpoint.indexed} ({stats['docs'] / elapsed:.0f} docs/sec)")
+
+
+async def fill_index(database, es_client, index_name: str, num_workers=NUM_WORKERS, batch_size=BATCH_SIZE, checkpoint_path=None, resume=False):
+    checkpoint = Checkpoint(checkpoint_path or f".indexer-{index_name}.json", index_name)
+    if resume:
+        checkpoint.load()
+        print(f"Resuming {index_name} after app {checkpoint.last_id} ({checkpoint.indexed} already indexed)")
+
+    queue = asyncio.Queue(maxsize=num_workers * 2)  # bounded, the producer never runs far ahead
+    stats = {"docs": 0, "start_time": time.time()}
+    workers = [
+        asyncio.create_task(worker(worker_id, database, es_client, index_name, queue, checkpoint, stats))
+        for worker_id in range(num_workers)
+    ]
+    producer = asyncio.create_task(produce_batches(database, queue, checkpoint, batch_size, num_workers))
+    try:
+        await asyncio.gather(producer, *workers)
+    except BaseException:
+        for task in [producer, *workers]:
+            task.cancel()
+        print(f"Indexing interrupted, resume with --resume (checkpoint at app {checkpoint.last_id})")
+        raise
+
+    total_time = time.time() - stats["start_time"]
+    print(f"Indexing complete: {checkpoint.indexed} documents ({checkpoint.failed} failed) in {total_time:.2f}s, "
+          f"{stats['docs'] / total_time:.0f} docs/sec")
+    checkpoint.remove()
+    return checkpoint.indexed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fill an Elasticsearch index from MySQL")
+    parser.add_argument("--index", required=True, help="index to fill")
+    parser.add_argument("--create", action="store_true", help="create the index with the current mapping first")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--checkpoint", help="checkpoint file (default .indexer-<index>.json)")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint of a previous run")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    await connect()
+    await connect_elastic()
+    try:
+        es_client = get_elasticsearch_async()
+        if args.create:
+            await create_index(es_client, args.index)
+        await fill_index(get_database(), es_client, args.index, args.workers, args.batch_size, args.checkpoint, args.resume)
+    finally:
+        await disconnect()
+        await close_elastic()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
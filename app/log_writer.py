@@ -0,0 +1,124 @@
+# log_writer.py
+# Buffered writer for append-only log tables. Requests only append a row in memory;
+# a background task flushes the buffer as one multi-row INSERT when LOG_BATCH_SIZE
+# rows are waiting or every LOG_FLUSH_INTERVAL seconds, and once more on shutdown.
+# The buffer is capped at LOG_MAX_BUFFERED rows: while MySQL is unreachable failed
+# batches are retried, and rows beyond the cap are dropped and counted. A batch rejected
+# for its data is written row by row so only the offending rows are dropped.
+import asyncio
+import time
+
+from pymysql.err import DataError, IntegrityError
+from sqlalchemy import insert, func
+
+from .models import download_log
+from .env import LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_MAX_BUFFERED
+
+
+class BufferedLogWriter:
+    def __init__(self, table, batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL, max_buffered: int = LOG_MAX_BUFFERED):
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.buffer = []
+        self.dropped = 0
+        self.rejected = 0
+        self.written = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, row: dict):
+        """
+        Queue a row, never blocks. Returns False when the buffer is full and the row was dropped.
+        """
+        if len(self.buffer) >= self.max_buffered:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"{self.table.name} buffer full, {self.dropped} rows dropped so far")
+            return False
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self, database):
+        async with self._flush_lock:
+            while self.buffer:
+                batch = self.buffer[:self.batch_size]
+                try:
+                    await database.execute(insert(self.table).values(batch))
+                    self.written += len(batch)
+                    consumed = len(batch)
+                except (DataError, IntegrityError) as e:
+                    print(f"{self.table.name} batch rejected ({e}), writing its rows one by one")
+                    consumed = await self.write_rows(database, batch)
+                except Exception as e:
+                    print(f"Failed to write {len(batch)} {self.table.name} rows, will retry: {e}")
+                    return
+                # Rows added while the insert ran are behind the batch, only drop what was handled
+                del self.buffer[:consumed]
+                if consumed < len(batch):
+                    return
+
+    async def write_rows(self, database, batch: list) -> int:
+        """
+        Insert rows individually, dropping those rejected for their data. Returns how many
+        rows were handled before a transient error, the rest stay buffered for a retry.
+        """
+        for i, row in enumerate(batch):
+            try:
+                await database.execute(insert(self.table).values(row))
+                self.written += 1
+            except (DataError, IntegrityError) as e:
+                self.rejected += 1
+                print(f"Dropping invalid {self.table.name} row {row}: {e}")
+            except Exception as e:
+                print(f"Failed to write {self.table.name} rows, will retry: {e}")
+                return i
+        return len(batch)
+
+    async def run(self, database):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush(database)
+
+    def start(self, database):
+        self._task = asyncio.create_task(self.run(database))
+
+    async def close(self, database):
+        """
+        Stop the background task and write whatever is still buffered.
+        """
+        # Let the task finish its current insert instead of cancelling it mid-write
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        await self.flush(database)
+        if self.buffer:
+            print(f"{len(self.buffer)} {self.table.name} rows could not be written on shutdown")
+
+    def stats(self) -> dict:
+        return {"buffered": len(self.buffer), "written": self.written, "dropped": self.dropped, "rejected": self.rejected}
+
+
+download_log_writer = BufferedLogWriter(download_log)
+
+
+def log_download(user_email: str, hash_value: str, user_agent: str, ip_address: str) -> bool:
+    return download_log_writer.add({
+        "email": user_email,
+        "hash": hash_value,
+        "user_agent": user_agent,
+        "ip_address": ip_address,
+        # Taken now, the row is only inserted on the next flush. FROM_UNIXTIME converts in the
+        # session time zone like the func.now() column default, so rows stay comparable
+        "timestamp": func.from_unixtime(time.time()),
+    })
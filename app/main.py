@@ -1,36 +1,77 @@
 # main.py
+import asyncio
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from .config import connect, disconnect, init_redis, close_redis, connect_elastic, close_elastic
-from .middlewares import DBConnectionMiddleware
-from .routes import app_routes, user_routes
+from .config import connect, disconnect, init_redis, close_redis, connect_elastic, close_elastic, get_database, get_elasticsearch_async, engine
+from .models import app_summary
+from .middlewares import HealthGateMiddleware
+from .health import health_supervisor
+from .file_index import file_index
+from .passwords import password_hasher
+from .log_writer import download_log_writer
+from .reference_data import reference_data
+from .search import detect_mapping_version, keep_mapping_version
+from .env import INDEX
+from .routes import app_routes, user_routes, admin_routes
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # /details reads it before falling back to the join query, it starts empty until app.summary fills it
+    app_summary.create(engine, checkfirst=True)
     await connect()
     await init_redis()
     await connect_elastic()
+    await reference_data.load(get_database())
+    reference_task = asyncio.create_task(reference_data.keep_fresh(get_database()))
+    try:
+        await detect_mapping_version(get_elasticsearch_async(), INDEX)
+    except Exception as e:
+        print(f"Could not read the search index mapping version, using the oldest: {e}")
+    mapping_task = asyncio.create_task(keep_mapping_version(get_elasticsearch_async, INDEX))
+    file_index_task = asyncio.create_task(file_index.keep_loaded())
+    health_task = asyncio.create_task(health_supervisor.run())
+    download_log_writer.start(get_database())
     yield
+    await download_log_writer.close(get_database())
+    health_task.cancel()
+    reference_task.cancel()
+    mapping_task.cancel()
+    file_index_task.cancel()
+    password_hasher.shutdown()
     await disconnect()
     await close_redis()
     await close_elastic()
 
 app = FastAPI(lifespan=lifespan)
 
+# Dependencies every request of a route touches, the gate answers 503 while one of them is down
+ROUTE_DEPENDENCIES = [
+    ("/api/search/", ["redis", "elasticsearch"]),
+    ("/api/suggest", ["elasticsearch"]),
+    ("/api/details", ["redis"]),
+    ("/api/version-details/", ["redis"]),
+    ("/api/generate-download-url/", ["mysql", "redis"]),
+    ("/api/register", ["mysql"]),
+    ("/api/login", ["mysql"]),
+    ("/api/admin/", ["mysql"]),
+]
+
+# Added first so it sits inside CORS and 503s still carry the CORS headers
+app.add_middleware(HealthGateMiddleware, supervisor=health_supervisor, route_dependencies=ROUTE_DEPENDENCIES) # Connections are kept alive by the health supervisor
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://localhost:3001"],  
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["x-total-count"]
+    expose_headers=["x-total-count", "x-next-cursor", "content-length", "content-range", "accept-ranges", "etag"]
 )
 
-app.add_middleware(DBConnectionMiddleware) # Maintains db connection: With long active time, OperationalError was thrown with new request
-
 app.include_router(app_routes.router, prefix="/api")
 app.include_router(user_routes.router, prefix="/api")
+app.include_router(admin_routes.router, prefix="/api")
 
 
 if __name__ == "__main__":
@@ -1,22 +1,35 @@
 # middlewares.py
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
-from sqlalchemy.exc import OperationalError
-from sqlalchemy import text
-from .config import database, connect
+from starlette.responses import JSONResponse
 
-class DBConnectionMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        try:
-            # Perform a simple query to test the connection
-            await database.execute(text("SELECT 1"))
-        except (OperationalError, Exception) as e:
-            # If the connection is lost, try to reconnect
-            try:
-                await connect()
-            except Exception as e:
-                return Response("Could not reconnect to the database", status_code=500)
+from .health import HealthSupervisor
 
-        response = await call_next(request)
-        return response
+
+class HealthGateMiddleware:
+    """
+    Pure ASGI gate in front of the routes: answers 503 right away when a dependency the
+    route needs is known to be down, instead of letting the request wait on timeouts.
+    Costs a dict lookup per request, the actual checks run in the health supervisor.
+    """
+    def __init__(self, app, supervisor: HealthSupervisor, route_dependencies: list):
+        self.app = app
+        self.supervisor = supervisor
+        self.route_dependencies = route_dependencies
+
+    def required(self, path: str) -> list:
+        for prefix, dependencies in self.route_dependencies:
+            if path.startswith(prefix):
+                return dependencies
+        return []
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] != "OPTIONS":
+            down = self.supervisor.down(self.required(scope["path"]))
+            if down:
+                response = JSONResponse(
+                    {"detail": f"Service unavailable: {', '.join(down)} down"},
+                    status_code=503,
+                    headers={"Retry-After": str(int(self.supervisor.interval))}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -1,5 +1,5 @@
 from .config import metadata
-from sqlalchemy import Table, Column, Integer, String, DateTime, Boolean, Float, func, Text, TIMESTAMP
+from sqlalchemy import Table, Column, Integer, BigInteger, String, DateTime, Date, Boolean, Float, func, Text, TIMESTAMP
 
 model_name = Table(
     #"visarg_model_name",
@@ -43,6 +43,9 @@ model_category_apps__model_app_categories = Table(
     Column("model_category_id", Integer, nullable=False),
 )
 
+# Maturity ratings are stored as model_category rows alongside regular categories
+MATURITY = ["Everyone", "Low Maturity", "Medium Maturity", "High Maturity"]
+
 model_category = Table(
     "model_category",
     metadata,
@@ -169,4 +172,54 @@ download_log = Table(
     Column("user_agent", Text, nullable=False),
     Column("ip_address", String, nullable=False),
     Column("timestamp", TIMESTAMP, default=func.now(), nullable=False),
-)
\ No newline at end of file
+)
+# Denormalized read model for /details, one row per app (maintained by summary.py)
+app_summary = Table(
+    "app_summary",
+    metadata,
+    Column("app_id", Integer, primary_key=True, autoincrement=False),
+    Column("package_name", String(255)),
+    Column("developer_id", String(255)),
+    Column("name", String(255)),
+    Column("description_id", Integer),
+    Column("text", Text),
+    Column("created_on", DateTime, nullable=True),
+    Column("categories", Text),
+    Column("maturity", Text),
+    Column("refreshed_on", DateTime, nullable=False, index=True),
+)
+
+# Download analytics rollups, built incrementally from download_logs.id (maintained by rollups.py)
+download_hourly = Table(
+    "download_hourly",
+    metadata,
+    Column("hour", DateTime, primary_key=True),
+    Column("hash", String(255), primary_key=True),
+    Column("package_name", String(255), index=True),
+    Column("downloads", Integer, nullable=False),
+)
+
+download_daily = Table(
+    "download_daily",
+    metadata,
+    Column("day", Date, primary_key=True),
+    Column("hash", String(255), primary_key=True),
+    Column("package_name", String(255), index=True),
+    Column("downloads", Integer, nullable=False),
+)
+
+user_download_daily = Table(
+    "user_download_daily",
+    metadata,
+    Column("day", Date, primary_key=True),
+    Column("email", String(255), primary_key=True),
+    Column("downloads", Integer, nullable=False),
+)
+
+rollup_state = Table(
+    "rollup_state",
+    metadata,
+    Column("name", String(64), primary_key=True),
+    Column("last_id", BigInteger, nullable=False),
+    Column("updated_on", DateTime, nullable=False),
+)
@@ -0,0 +1,52 @@
+# passwords.py
+# bcrypt hashing and verification off the event loop. Each call takes tens to hundreds
+# of milliseconds of CPU, so they run in a small dedicated thread pool (bcrypt releases
+# the GIL) with a cap on queued work: when a login burst fills the queue, callers get
+# PasswordHasherBusy right away instead of stalling searches and downloads.
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from .env import BCRYPT_WORKERS, BCRYPT_MAX_PENDING
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.max_pending = max_pending
+        self.pending = 0  # running + queued, only touched from the event loop thread
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            raise PasswordHasherBusy()
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self.pending -= 1
+            raise
+        # Released when the work itself ends: a cancelled caller leaves the bcrypt call running
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.release))
+        return await asyncio.wrap_future(future)
+
+    def release(self):
+        self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        hashed_password = await self.run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt())
+        return hashed_password.decode('utf-8')
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self.run(bcrypt.checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(BCRYPT_WORKERS, BCRYPT_MAX_PENDING)
@@ -0,0 +1,135 @@
+# rate_limit.py
+# Redis rate limiting. Every check is one Lua script call, so it costs a single round
+# trip and stays correct under concurrency across workers. Three algorithms:
+#
+#   fixed_window    counter per window, reset when the window expires
+#   sliding_window  log of request times over the last period (exact, one entry per request)
+#   token_bucket    `limit` tokens refilled evenly over `period`, up to `burst` at once
+#
+# Policies are configured per route, with optional per-user overrides, and can be
+# replaced through the RATE_LIMITS environment variable (JSON, same shape as below).
+import hashlib
+import json
+import math
+import uuid
+
+from redis.exceptions import NoScriptError
+
+from .env import RATE_LIMITS
+
+DEFAULT_POLICIES = {
+    # 10 download links per user per hour
+    "download": {"algorithm": "sliding_window", "limit": 10, "period": 3600},
+}
+
+# Time comes from the Redis server so every worker shares one clock.
+# All scripts return {allowed, remaining, retry_after_ms}.
+FIXED_WINDOW_SCRIPT = """
+local count = redis.call('incr', KEYS[1])
+if count == 1 then
+    redis.call('pexpire', KEYS[1], ARGV[2])
+end
+local limit = tonumber(ARGV[1])
+if count > limit then
+    return {0, 0, redis.call('pttl', KEYS[1])}
+end
+return {1, limit - count, 0}
+"""
+
+SLIDING_WINDOW_SCRIPT = """
+local now = redis.call('time')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+redis.call('zremrangebyscore', KEYS[1], '-inf', now - period)
+local count = redis.call('zcard', KEYS[1])
+if count < limit then
+    redis.call('zadd', KEYS[1], now, ARGV[3])
+    redis.call('pexpire', KEYS[1], period)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call('zrange', KEYS[1], 0, 0, 'withscores')
+return {0, 0, tonumber(oldest[2]) + period - now}
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('time')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local rate = tonumber(ARGV[1]) / tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+local allowed, retry_after = 0, 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil((1 - tokens) / rate)
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('pexpire', KEYS[1], math.ceil(capacity / rate))
+return {allowed, math.floor(tokens), retry_after}
+"""
+
+SCRIPTS = {
+    "fixed_window": FIXED_WINDOW_SCRIPT,
+    "sliding_window": SLIDING_WINDOW_SCRIPT,
+    "token_bucket": TOKEN_BUCKET_SCRIPT,
+}
+
+
+class RateLimitResult:
+    def __init__(self, allowed: bool, remaining: int, retry_after: int):
+        self.allowed = allowed
+        self.remaining = remaining
+        self.retry_after = retry_after  # seconds until the next request would be allowed
+
+
+class RateLimiter:
+    def __init__(self, policies: dict):
+        for route, policy in policies.items():
+            if policy["algorithm"] not in SCRIPTS:
+                raise ValueError(f"Unknown rate limit algorithm for {route}: {policy['algorithm']}")
+        self.policies = policies
+        self.shas = {name: hashlib.sha1(script.encode("utf-8")).hexdigest() for name, script in SCRIPTS.items()}
+
+    def policy(self, route: str, identity: str) -> dict:
+        """
+        Route policy with the user's override, if any, applied on top.
+        """
+        policy = self.policies[route]
+        override = policy.get("users", {}).get(identity)
+        return {**policy, **override} if override else policy
+
+    def script_args(self, policy: dict) -> list:
+        period_ms = int(policy["period"] * 1000)
+        if policy["algorithm"] == "fixed_window":
+            return [policy["limit"], period_ms]
+        if policy["algorithm"] == "sliding_window":
+            return [policy["limit"], period_ms, uuid.uuid4().hex]
+        return [policy["limit"], period_ms, policy.get("burst", policy["limit"])]
+
+    async def hit(self, redis_client, route: str, identity: str) -> RateLimitResult:
+        """
+        Count one request by identity against the route's policy.
+        """
+        policy = self.policy(route, identity)
+        algorithm = policy["algorithm"]
+        key = f"rate:{route}:{algorithm}:{identity}"  # an override switching algorithms gets its own key type
+        args = self.script_args(policy)
+        try:
+            try:
+                allowed, remaining, retry_after_ms = await redis_client.evalsha(self.shas[algorithm], 1, key, *args)
+            except NoScriptError:
+                # First use since Redis started, EVAL also caches the script
+                allowed, remaining, retry_after_ms = await redis_client.eval(SCRIPTS[algorithm], 1, key, *args)
+        except Exception as e:
+            # Fail open: a Redis outage should not block every download
+            print(f"Rate limit check for {route} failed: {e}")
+            return RateLimitResult(True, 0, 0)
+        return RateLimitResult(bool(allowed), int(remaining), math.ceil(int(retry_after_ms) / 1000))
+
+
+rate_limiter = RateLimiter(json.loads(RATE_LIMITS) if RATE_LIMITS else DEFAULT_POLICIES)
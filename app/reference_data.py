@@ -0,0 +1,59 @@
+# reference_data.py
+# In-memory registry of reference data: category names and maturity levels. Loaded once
+# at startup and refreshed in the background, so endpoints and the search builder read
+# it with dict/set lookups and no I/O.
+import asyncio
+
+from sqlalchemy import select
+
+from .cache import json_body, cache_entry
+from .models import model_category, MATURITY
+from .env import REFERENCE_REFRESH_INTERVAL
+
+MATURITY_LEVELS = frozenset(MATURITY)
+
+
+class ReferenceData:
+    def __init__(self):
+        self.maturity = list(MATURITY)
+        self.maturity_entry = cache_entry(json_body(self.maturity))
+        self.categories = []  # distinct names, maturity levels excluded
+        self.categories_entry = None  # serialized categories with their ETag, for /categories
+        self._canonical = {}  # lower-cased name -> stored name
+
+    def is_maturity(self, name: str) -> bool:
+        return name in MATURITY_LEVELS
+
+    def canonical_category(self, name: str) -> str:
+        """
+        Category or maturity name as stored, matched case-insensitively. Unknown names are returned unchanged.
+        """
+        return self._canonical.get(name.lower(), name)
+
+    async def load(self, database):
+        rows = await database.fetch_all(select(model_category.c.name))
+
+        # model_category has one row per marketplace and crawl, keep distinct names
+        names = {row["name"] for row in rows if row["name"]}
+        categories = sorted(name for name in names if name not in MATURITY_LEVELS)
+        canonical = {name.lower(): name for name in list(names) + self.maturity}
+
+        # Swapped in without awaiting in between, readers never see a half-built registry
+        self.categories = categories
+        self.categories_entry = cache_entry(json_body(categories))
+        self._canonical = canonical
+        print(f"Loaded reference data: {len(categories)} categories from {len(rows)} rows")
+
+    async def keep_fresh(self, database, interval: float = REFERENCE_REFRESH_INTERVAL):
+        """
+        Background task: reload periodically, keeping the previous data if a reload fails.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load(database)
+            except Exception as e:
+                print(f"Reference data refresh failed: {e}")
+
+
+reference_data = ReferenceData()
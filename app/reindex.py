@@ -0,0 +1,184 @@
+# reindex.py
+# Blue/green reindexing behind a read alias. Point ES_INDEX at the alias, then:
+#
+#   python -m app.reindex --alias apps                # build a new index and swap the alias to it
+#   python -m app.reindex --alias apps --rollback     # point the alias back to the previous index
+#
+# The new index is built with replicas off and refresh disabled, then settings are
+# restored, segments force-merged and the alias swapped in one atomic update. Live
+# search keeps hitting the old index until the swap; the old index is kept for rollback.
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from .config import connect, disconnect, connect_elastic, close_elastic, get_database, get_elasticsearch_async
+from .index_mapping import create_index, MAPPING_VERSION
+from .indexer import fill_index, NUM_WORKERS, BATCH_SIZE
+from .sync import sync_once
+from .watermarks import Watermarks
+
+BULK_SETTINGS = {"number_of_replicas": 0, "refresh_interval": "-1"}
+DEFAULT_REPLICAS = 1
+LIVE_REFRESH_INTERVAL = "1s"
+KEEP_INDICES = 2  # the live index plus one for rollback
+
+
+def new_index_name(alias: str) -> str:
+    return f"{alias}-v{MAPPING_VERSION}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+
+
+async def alias_indices(es_client, alias: str) -> list:
+    if not await es_client.indices.exists_alias(name=alias):
+        return []
+    return list((await es_client.indices.get_alias(name=alias)).keys())
+
+
+async def managed_indices(es_client, alias: str) -> list:
+    """
+    Indices built for this alias, oldest first (names sort by build timestamp).
+    """
+    indices = await es_client.indices.get(index=f"{alias}-v*", expand_wildcards="open")
+    return sorted(indices.keys(), key=lambda name: name.rsplit("-", 1)[-1])
+
+
+async def live_replicas(es_client, indices: list) -> int:
+    if not indices:
+        return DEFAULT_REPLICAS
+    settings = await es_client.indices.get_settings(index=indices[0], name="index.number_of_replicas")
+    return int(settings[indices[0]]["settings"]["index"]["number_of_replicas"])
+
+
+async def mark_complete(es_client, index_name: str, complete: bool):
+    await es_client.indices.put_mapping(index=index_name, meta={"mapping_version": MAPPING_VERSION, "complete": complete})
+
+
+async def is_complete(es_client, index_name: str) -> bool:
+    """
+    False only for indices explicitly marked incomplete, indices built before the flag existed count as complete.
+    """
+    mapping = await es_client.indices.get_mapping(index=index_name)
+    return mapping[index_name]["mappings"].get("_meta", {}).get("complete", True) is not False
+
+
+async def older_than_live(es_client, alias: str) -> list:
+    """
+    Complete, non-live indices built before the oldest live one, oldest first. Newer
+    non-live indices are builds in progress or failed leftovers, never rollback targets.
+    """
+    live = await alias_indices(es_client, alias)
+    indices = await managed_indices(es_client, alias)
+    live_positions = [position for position, index_name in enumerate(indices) if index_name in live]
+    candidates = indices[:live_positions[0]] if live_positions else [index_name for index_name in indices if index_name not in live]
+    return [index_name for index_name in candidates if await is_complete(es_client, index_name)]
+
+
+async def finalize_index(es_client, index_name: str, replicas: int):
+    """
+    Restore live settings on a freshly built index and compact it before it takes traffic,
+    then mark it complete so it can be rolled back to later.
+    """
+    # Merge while there are no replicas yet, they then copy the merged segment once
+    await es_client.indices.refresh(index=index_name)
+    await es_client.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=3600)
+    await es_client.indices.put_settings(index=index_name, settings={
+        "number_of_replicas": replicas,
+        "refresh_interval": LIVE_REFRESH_INTERVAL
+    })
+    await es_client.cluster.health(index=index_name, wait_for_status="yellow" if replicas == 0 else "green", timeout="30m", request_timeout=1900)
+    await mark_complete(es_client, index_name, True)
+
+
+async def check_alias_name(es_client, alias: str):
+    """
+    The alias name must not be taken by a concrete index, checked before any work is done.
+    """
+    if not await es_client.indices.exists_alias(name=alias) and await es_client.indices.exists(index=alias):
+        raise ValueError(f"'{alias}' is a concrete index, reindex under a different alias name or delete it first")
+
+
+async def swap_alias(es_client, alias: str, index_name: str):
+    """
+    Atomically move the alias to index_name, removing it from every other index.
+    """
+    actions = [{"remove": {"index": old_index, "alias": alias}} for old_index in await alias_indices(es_client, alias) if old_index != index_name]
+    actions.append({"add": {"index": index_name, "alias": alias, "is_write_index": True}})
+    await es_client.indices.update_aliases(actions=actions)
+    print(f"Alias {alias} -> {index_name}")
+
+
+async def prune_indices(es_client, alias: str, keep: int):
+    """
+    Keep the live index plus the keep - 1 newest complete indices before it.
+    """
+    previous = await older_than_live(es_client, alias)
+    for index_name in previous[:max(len(previous) - (keep - 1), 0)]:
+        await es_client.indices.delete(index=index_name)
+        print(f"Deleted old index {index_name}")
+
+
+async def reindex(database, es_client, alias: str, num_workers=NUM_WORKERS, batch_size=BATCH_SIZE, keep=KEEP_INDICES):
+    start_time = time.time()
+    await check_alias_name(es_client, alias)
+    build_start = datetime.utcnow()
+    replicas = await live_replicas(es_client, await alias_indices(es_client, alias))
+
+    index_name = new_index_name(alias)
+    await create_index(es_client, index_name, BULK_SETTINGS)
+    try:
+        await mark_complete(es_client, index_name, False)
+        await fill_index(database, es_client, index_name, num_workers, batch_size)
+        await finalize_index(es_client, index_name, replicas)
+
+        # Catch up on changes made while the build was running, then go live
+        watermarks = Watermarks(f".sync-{alias}.json", alias)
+        await sync_once(database, es_client, index_name, watermarks, build_start)
+        await es_client.indices.refresh(index=index_name)
+        await swap_alias(es_client, alias, index_name)
+    except BaseException:
+        # A half-built index must never become a rollback target
+        print(f"Reindex of {alias} failed, deleting {index_name}")
+        await es_client.indices.delete(index=index_name, ignore_unavailable=True)
+        raise
+
+    await prune_indices(es_client, alias, keep)
+    print(f"Reindex of {alias} complete in {time.time() - start_time:.2f}s")
+    return index_name
+
+
+async def rollback(es_client, alias: str):
+    await check_alias_name(es_client, alias)
+    previous = await older_than_live(es_client, alias)
+    if not previous:
+        raise ValueError(f"No previous index to roll {alias} back to")
+    await swap_alias(es_client, alias, previous[-1])
+    return previous[-1]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Blue/green reindex behind an alias")
+    parser.add_argument("--alias", required=True, help="read alias searched by the API (ES_INDEX)")
+    parser.add_argument("--rollback", action="store_true", help="point the alias back to the previous index")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--keep", type=int, default=KEEP_INDICES, help="indices to keep, including the live one")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    await connect()
+    await connect_elastic()
+    try:
+        es_client = get_elasticsearch_async()
+        if args.rollback:
+            await rollback(es_client, args.alias)
+        else:
+            await reindex(get_database(), es_client, args.alias, args.workers, args.batch_size, max(args.keep, 2))
+    finally:
+        await disconnect()
+        await close_elastic()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+# rollups.py
+# Download analytics rollups. Raw download_logs rows are folded, in id order, into
+# per hash/package hourly and daily counts and per user daily counts; the admin
+# analytics endpoints read only these tables. Progress is the last folded log id:
+#
+#   python -m app.rollups                   # one pass (cron)
+#   python -m app.rollups --interval 300    # run continuously
+#   python -m app.rollups --rebuild         # clear the rollups and fold the whole log again
+#
+# Log rows are inserted concurrently by several workers, and InnoDB may commit a higher
+# id before a lower one. Each pass therefore only folds up to the max id observed on an
+# earlier pass at least COMMIT_LAG ago, by which time every lower id has committed.
+import argparse
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from .config import connect, disconnect, get_database, engine
+from .models import download_log, model_download, model_app
+from .models import download_hourly, download_daily, user_download_daily, rollup_state
+
+BATCH_SIZE = 10000
+STATE_NAME = "downloads"
+HORIZON_NAME = "downloads:horizon"  # last_id holds the max log id observed at updated_on
+COMMIT_LAG = timedelta(seconds=60)
+ROLLUP_TABLES = [download_hourly, download_daily, user_download_daily]
+
+
+async def package_names(database, hashes: list) -> dict:
+    query = (
+        select(model_download.c.hash, model_app.c.app_id)
+        .select_from(model_download.join(model_app, model_download.c.app_id == model_app.c.id))
+        .where(model_download.c.hash.in_(hashes))
+    )
+    return {row["hash"]: row["app_id"] for row in await database.fetch_all(query)}
+
+
+async def add_counts(database, table, rows: list):
+    """
+    Upsert rows, adding their downloads to existing counts.
+    """
+    if not rows:
+        return
+    stmt = mysql_insert(table).values(rows)
+    await database.execute(stmt.on_duplicate_key_update(downloads=table.c.downloads + stmt.inserted.downloads))
+
+
+async def observe_horizon(database):
+    """
+    Record the current max log id, it becomes foldable COMMIT_LAG from now.
+    """
+    max_id = await database.fetch_val(select(func.max(download_log.c.id))) or 0
+    stmt = mysql_insert(rollup_state).values(name=HORIZON_NAME, last_id=max_id, updated_on=datetime.utcnow())
+    await database.execute(stmt.on_duplicate_key_update(last_id=stmt.inserted.last_id, updated_on=stmt.inserted.updated_on))
+
+
+async def fold_batch(database, upper_id: int, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Fold the next batch of log rows up to upper_id into the rollups. The counts and the new last_id are
+    written in one transaction and the state row is locked, so a batch is never counted
+    twice, even with two runners.
+    """
+    async with database.transaction():
+        last_id = await database.fetch_val(
+            select(rollup_state.c.last_id).where(rollup_state.c.name == STATE_NAME).with_for_update()
+        )
+        if last_id is None:
+            await database.execute(mysql_insert(rollup_state).values(name=STATE_NAME, last_id=0, updated_on=datetime.utcnow()).prefix_with("IGNORE"))
+            last_id = 0
+
+        query = (
+            select(download_log.c.id, download_log.c.email, download_log.c.hash, download_log.c.timestamp)
+            .where(download_log.c.id > last_id, download_log.c.id <= upper_id)
+            .order_by(download_log.c.id)
+            .limit(batch_size)
+        )
+        logs = await database.fetch_all(query)
+        if not logs:
+            return 0
+
+        hourly, daily, users = Counter(), Counter(), Counter()
+        for log in logs:
+            timestamp = log["timestamp"]
+            hourly[(timestamp.replace(minute=0, second=0, microsecond=0), log["hash"])] += 1
+            daily[(timestamp.date(), log["hash"])] += 1
+            users[(timestamp.date(), log["email"])] += 1
+        packages = await package_names(database, list({log["hash"] for log in logs}))
+
+        await add_counts(database, download_hourly, [
+            {"hour": hour, "hash": hash_value, "package_name": packages.get(hash_value), "downloads": count}
+            for (hour, hash_value), count in hourly.items()
+        ])
+        await add_counts(database, download_daily, [
+            {"day": day, "hash": hash_value, "package_name": packages.get(hash_value), "downloads": count}
+            for (day, hash_value), count in daily.items()
+        ])
+        await add_counts(database, user_download_daily, [
+            {"day": day, "email": email, "downloads": count}
+            for (day, email), count in users.items()
+        ])
+        await database.execute(
+            rollup_state.update()
+            .where(rollup_state.c.name == STATE_NAME)
+            .values(last_id=logs[-1]["id"], updated_on=datetime.utcnow())
+        )
+        return len(logs)
+
+
+async def update_rollups(database, batch_size: int = BATCH_SIZE) -> int:
+    start_time = time.time()
+    total = 0
+    observation = await database.fetch_one(select(rollup_state).where(rollup_state.c.name == HORIZON_NAME))
+    if observation is None:
+        await observe_horizon(database)
+        print(f"Rollups: horizon recorded, rows become foldable after {COMMIT_LAG.total_seconds():.0f}s")
+        return 0
+    if observation["updated_on"] > datetime.utcnow() - COMMIT_LAG:
+        # Not aged yet, keep it rather than replacing it so it eventually becomes usable
+        print("Rollups: horizon too recent, nothing to fold yet")
+        return 0
+
+    while True:
+        folded = await fold_batch(database, observation["last_id"], batch_size)
+        total += folded
+        if folded < batch_size:
+            break
+        print(f"Rollups: {total} log rows folded ({total / (time.time() - start_time):.0f} rows/sec)")
+    # Replaced only once everything below it has been folded
+    await observe_horizon(database)
+    print(f"Rollups: {total} new log rows folded in {time.time() - start_time:.2f}s")
+    return total
+
+
+async def clear_rollups(database):
+    async with database.transaction():
+        for table in ROLLUP_TABLES:
+            await database.execute(delete(table))
+        await database.execute(delete(rollup_state).where(rollup_state.c.name == STATE_NAME))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fold download_logs into the analytics rollups")
+    parser.add_argument("--rebuild", action="store_true", help="clear the rollups and fold the whole log again")
+    parser.add_argument("--interval", type=float, help="keep running, folding new rows every N seconds")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    for table in ROLLUP_TABLES + [rollup_state]:
+        table.create(engine, checkfirst=True)
+
+    await connect()
+    try:
+        database = get_database()
+        if args.rebuild:
+            await clear_rollups(database)
+        while True:
+            await update_rollups(database, args.batch_size)
+            if not args.interval:
+                break
+            await asyncio.sleep(args.interval)
+    finally:
+        await disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
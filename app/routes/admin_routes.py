@@ -0,0 +1,113 @@
+# admin_routes.py
+# Download analytics for admins. Reads only the rollup tables maintained by rollups.py,
+# never the raw download_logs, so response times do not grow with the log.
+from fastapi import APIRouter, HTTPException, Query, Depends
+from sqlalchemy import select, func
+from databases import Database
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from ..config import get_database
+from ..models import download_hourly, download_daily, user_download_daily, rollup_state
+from ..rollups import STATE_NAME
+from .user_routes import get_admin_user
+
+router = APIRouter(prefix="/admin/analytics", dependencies=[Depends(get_admin_user)])
+
+MAX_DAYS = 366
+MAX_HOURS = 24 * 31
+
+
+def date_range(start: Optional[date], end: Optional[date], default_days: int = 7):
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=default_days - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range too long, at most {MAX_DAYS} days")
+    return start, end
+
+
+@router.get("/downloads")
+async def downloads_over_time(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    package_name: Optional[str] = None,
+    hash: Optional[str] = None,
+    database: Database = Depends(get_database)
+):
+    """
+    Download counts per hour or day, for everything or one package/hash.
+    """
+    start, end = date_range(start, end)
+    if granularity == "hour":
+        if (end - start).days * 24 >= MAX_HOURS:
+            raise HTTPException(status_code=400, detail=f"Range too long for hourly data, at most {MAX_HOURS // 24} days")
+        table, bucket = download_hourly, download_hourly.c.hour
+        lower, upper = datetime.combine(start, time.min), datetime.combine(end + timedelta(days=1), time.min)
+        in_range = (bucket >= lower) & (bucket < upper)
+    else:
+        table, bucket = download_daily, download_daily.c.day
+        in_range = (bucket >= start) & (bucket <= end)
+
+    query = select(bucket.label("bucket"), func.sum(table.c.downloads).label("downloads")).where(in_range)
+    if package_name:
+        query = query.where(table.c.package_name == package_name)
+    if hash:
+        query = query.where(table.c.hash == hash)
+    query = query.group_by(bucket).order_by(bucket)
+
+    rows = await database.fetch_all(query)
+    return [{"bucket": row["bucket"].isoformat(), "downloads": int(row["downloads"])} for row in rows]
+
+
+@router.get("/top-packages")
+async def top_packages(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(20, ge=1, le=100),
+    database: Database = Depends(get_database)
+):
+    start, end = date_range(start, end)
+    downloads = func.sum(download_daily.c.downloads).label("downloads")
+    query = (
+        select(download_daily.c.package_name, downloads)
+        .where(download_daily.c.day >= start, download_daily.c.day <= end)
+        .group_by(download_daily.c.package_name)
+        .order_by(downloads.desc())
+        .limit(limit)
+    )
+    rows = await database.fetch_all(query)
+    return [{"package_name": row["package_name"], "downloads": int(row["downloads"])} for row in rows]
+
+
+@router.get("/top-users")
+async def top_users(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(20, ge=1, le=100),
+    database: Database = Depends(get_database)
+):
+    start, end = date_range(start, end)
+    downloads = func.sum(user_download_daily.c.downloads).label("downloads")
+    query = (
+        select(user_download_daily.c.email, downloads)
+        .where(user_download_daily.c.day >= start, user_download_daily.c.day <= end)
+        .group_by(user_download_daily.c.email)
+        .order_by(downloads.desc())
+        .limit(limit)
+    )
+    rows = await database.fetch_all(query)
+    return [{"email": row["email"], "downloads": int(row["downloads"])} for row in rows]
+
+
+@router.get("/status")
+async def rollup_status(database: Database = Depends(get_database)):
+    """
+    How far the rollups have caught up with the log.
+    """
+    row = await database.fetch_one(select(rollup_state).where(rollup_state.c.name == STATE_NAME))
+    if row is None:
+        return {"last_id": 0, "updated_on": None}
+    return {"last_id": row["last_id"], "updated_on": row["updated_on"].isoformat()}
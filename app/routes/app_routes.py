@@ -1,30 +1,39 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Response, Depends, Request
-from fastapi.responses import JSONResponse, StreamingResponse
-from sqlalchemy import insert, select, func, extract, and_
-from pymysql.err import MySQLError
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, func, and_
 from pydantic import ValidationError
 from sqlalchemy.dialects import postgresql
 from typing import List, Optional
 from databases import Database
 from datetime import datetime, timedelta
-from elasticsearch import helpers
+from elasticsearch import helpers, NotFoundError
 import time
-import os
-import json
 import jwt
 import asyncio
 
 from ..config import get_database, get_redis, get_elasticsearch_async
 from ..models import model_description, model_app, model_developer, model_category_apps__model_app_categories, model_category, model_sdkversion
 from ..models import model_name, model_download, model_version, model_androidmanifest, model_app_permissions, model_permissionrequested, model_rating
-from ..models import download_log
+from ..models import app_summary
+from ..reference_data import reference_data
 from ..schemas import AppResults, AppDetails, VersionDetails, QueryParams
-from .user_routes import get_current_user
+from .user_routes import get_current_user, get_admin_user
+from ..file_serving import RangeFileResponse
+from ..file_index import find_file_path
+from ..health import health_supervisor
+from ..rate_limit import rate_limiter
+from ..log_writer import log_download, download_log_writer
 from ..env import SECRET_KEY, ALGORITHM, INDEX
+from ..search import build_search_query, faceted_search_body, parse_facets, search_source_fields, hit_name
+from ..search import suggest_body, parse_suggestions
+from ..search import FIRST_CURSOR, PIT_KEEP_ALIVE, CURSOR_SORT, InvalidCursor, encode_cursor, decode_cursor
+from ..cache import normalize_search_params, search_cache_key, search_fingerprint, search_cache_stats, cache_stats, single_flight
+from ..cache import details_l1, version_details_l1, suggest_l1
+from ..cache import json_body, cache_entry, cached_json_response, DETAILS_CACHE_CONTROL, REFERENCE_CACHE_CONTROL, SUGGEST_CACHE_CONTROL
 
-MATURITY = ["Everyone", "Low Maturity", "Medium Maturity", "High Maturity"]
 ACCESS_TOKEN_EXPIRE_MINUTES = 5  # validity for pre-signed url
 cache_expiration = 43200
+MAX_RESULT_WINDOW = 50000  # index.max_result_window, bounds from/size pagination
 
 router = APIRouter()
 
@@ -181,6 +190,8 @@ async def get_query_params(
     downloadable: Optional[bool] = True,
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    facets: bool = False,
 ):
     try:
         # Validate parameters with Pydantic
@@ -195,6 +206,8 @@ async def get_query_params(
             downloadable=downloadable,
             page=page,
             limit=limit,
+            cursor=cursor,
+            facets=facets,
         )
         return params.dict()
     except ValidationError as e:
@@ -208,246 +221,233 @@ async def search_apps(
     es_client = Depends(get_elasticsearch_async),
     redis_client=Depends(get_redis)
 ):
+    params = normalize_search_params(params)
+    if params["cursor"]:
+        # Cursor mode: every page costs the same as the first, no result window limit
+        return await search_with_cursor(response, params, es_client)
+
     offset = (params["page"] - 1) * params["limit"]
+    if offset + params["limit"] > MAX_RESULT_WINDOW:
+        raise HTTPException(status_code=400, detail=f"Page too deep for offset pagination, use cursor=* to page beyond {MAX_RESULT_WINDOW} results")
 
-    cache_key = f"search:{hash(frozenset(params.items()))}:{offset}:{params['limit']}"
+    # Facets are stored next to the hits under the same key, the flag only says whether to return them
+    with_facets = params["facets"]
+    cache_key = search_cache_key({k: v for k, v in params.items() if k != "facets"})
     
     print(cache_key)
 
     try:
-        # Check if the query result is cached
-        cached_result = await redis_client.get(cache_key)
+        # Check if the query result is cached, hits are stored as ready-to-send JSON
+        cached_result = await read_cached_search(redis_client, cache_key, with_facets)
         if cached_result:
-            # Load cached result and set headers
-            cached_data = json.loads(cached_result)
+            search_cache_stats.hit()
             await redis_client.expire(cache_key, cache_expiration)
-            response.headers["x-total-count"] = str(cached_data["total_count"])
-            return cached_data["hits"]
+            return search_response(*cached_result)
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=f"Failed to retrieve cached results: {e}")
 
-    
-    # Combine categories and maturity terms
-    category_maturity_terms = []
-    if params["categories"]:
-        category_maturity_terms += params["categories"].split(",")
-    if params["maturity"]:
-        category_maturity_terms += params["maturity"].split(",")
-
-    # Construct the Elasticsearch query
-    es_query = {"bool": {"must": [], "should": [], "filter": []}}
-
-    # Keyword search across multiple fields (OR logic internally)
-    if params["keyword"]:
-        es_query["bool"]["should"].extend([
-            # Search in names
-            {
-                "nested": {
-                    "path": "names",
-                    "query": {
-                        "match": {
-                            "names.name": {
-                                "query": params["keyword"],
-                                "operator": "AND",
-                                "fuzziness": "AUTO"
-                            }
-                        }
-                    }
-                }
-            },
-            # Search in descriptions
-            {
-                "nested": {
-                    "path": "descriptions",
-                    "query": {
-                        "match": {
-                            "descriptions.description": {
-                                "query": params["keyword"],
-                                "operator": "AND",
-                                "fuzziness": "AUTO"
-                            }
-                        }
-                    }
-                }
-            },
-            # Search in package_name using raw field for exact or wildcard search
-            {
-                "wildcard": {
-                    "package_name.raw": {
-                        "value": f"*{params['keyword']}*",  # Substring match
-                        "case_insensitive": True
-                    }
-                }
-            },
-            # Search in developer_name for partial matches
-            {
-                "match": {
-                    "developer_name": {
-                        "query": params["keyword"],
-                        "operator": "AND",
-                        "fuzziness": "AUTO"
-                    }
-                }
-            },
-            # Search in categories for exact matches
-            {
-                "term": {
-                    "categories": {
-                        "value": params["keyword"]
-                    }
-                }
-            },
-            # Search in versions.permissions using raw field for exact or wildcard match
-            {
-                "nested": {
-                    "path": "versions",
-                    "query": {
-                        "wildcard": {
-                            "versions.permissions.raw": {
-                                "value": f"*{params['keyword']}*",  # Substring match
-                                "case_insensitive": True
-                            }
-                        }
-                    }
-                }
-            }
-        ])
-        es_query["bool"]["minimum_should_match"] = 1  # At least one of the should clauses must match
-
-    if params["query"]:
-        es_query["bool"]["must"].append({
-            "nested": {
-                "path": "names",
-                "query": {
-                    "match": {
-                        "names.name": {
-                            "query": params["query"],
-                            "operator": "AND",
-                            "fuzziness": "AUTO"
-                        }
-                    }
-                }
-            }
-        })
+    search_cache_stats.miss()
 
+    async def compute():
+        body = faceted_search_body(params) if with_facets else {"query": build_search_query(params)}
+        print(body)
 
-    if params.get("package_name"):
-        es_query["bool"]["must"].append({
-            "wildcard": {
-                "package_name.raw": {
-                    "value": f"*{params['package_name']}*",  # Match substring
-                    "case_insensitive": True  # Make it case-insensitive
-                }
-            }
-        })
-    
-    if params["developer_name"]:
-        es_query["bool"]["must"].append({
-            "match_phrase": {
-                "developer_name": params["developer_name"]
-            }
-        })
-    
-    if category_maturity_terms:
-        # Ensure all specified categories/maturity terms match exactly
-        es_query["bool"]["must"].append({
-            "terms_set": {
-                "categories": {
-                    "terms": category_maturity_terms,
-                    "minimum_should_match_script": {
-                        "source": "params.num_terms"
-                    }
-                }
-            }
-        })
-
-    if params["permissions"]:
-        permissions_terms = params["permissions"].split(",")
-        es_query["bool"]["must"].append({
-            "nested": {
-                "path": "versions",
-                "query": {
-                    "bool": {
-                        "must": [
-                            {
-                                "wildcard": {
-                                    "versions.permissions.raw": {
-                                        "value": f"*{perm.strip()}*",
-                                        "case_insensitive": True
-                                    }
-                                }
-                            } for perm in permissions_terms
-                        ]
-                    }
-                }
-            }
-        })
-
-    # Check if the app is downloadable (has at least one version)
-    if params["downloadable"]:
-        es_query["bool"]["filter"].append({
-            "nested": {
-                "path": "versions",
-                "query": {"exists": {"field": "versions"}}
-            }
-        })
-
-    print(es_query)
-    try:
-        # Step 1: Use _count endpoint to get total count
-        count_response = await es_client.count(
-            index=INDEX,
-            body={"query": es_query}
-        )
-        total_count = count_response["count"]
-        print(total_count)
-        
-        # Step 2: Retrieve paginated search results
+        # Single request for the exact total, the page and the facets, fetching only the fields we return
         es_response = await es_client.search(
             index=INDEX,
             body={
+                **body,
                 "size": params["limit"],
                 "from": offset,
-                "query": es_query
+                "track_total_hits": True,
+                "_source": search_source_fields()
             }
         )
+        total_count = es_response["hits"]["total"]["value"]
         
         # Extract and process hits
         hits = []
         for i, hit in enumerate(es_response["hits"]["hits"], start=1 + offset):
             source = hit["_source"]
 
-            # Find the latest name based on `created_on`
-            latest_name_entry = max(source.get("names", []), key=lambda x: x["created_on"], default={})
-            latest_name = latest_name_entry.get("name", "")
-
             # Construct the filtered document
             hits.append({
                 "id": i,  # Incremental ID based on the document's position
                 "app_id": source.get("app_id"),
-                "name": latest_name,
+                "name": hit_name(source),
                 "package_name": source.get("package_name")
             })
 
-        # Set response headers
-        if total_count >= 50000:
-            total_count = 50000 # elastic search limitation, solution -> scroll api or config
+        if total_count >= MAX_RESULT_WINDOW:
+            total_count = MAX_RESULT_WINDOW # offset pages beyond the result window are unreachable, cursor mode reports the real total
             
-        # Cache the result in Redis with a 6 hr expiration time
-        await redis_client.set(
-            cache_key,
-            json.dumps({"total_count": total_count, "hits": hits}),
-            ex=cache_expiration  # Expiration time in seconds 
-        )
-        
-        response.headers["x-total-count"] = str(total_count)
-        return hits
+        cached = {"total_count": total_count, "hits": json_body(hits)}
+        if with_facets:
+            cached["facets"] = json_body(parse_facets(es_response["aggregations"]))
+        # Cache the result in Redis with a 12 hr expiration time
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(cache_key, mapping=cached)
+        pipe.expire(cache_key, cache_expiration)
+        await pipe.execute()
+        return total_count, cached["hits"], cached.get("facets")
+
+    try:
+        # Concurrent misses on the same key share one ES request
+        flight_key = f"{cache_key}:facets" if with_facets else cache_key
+        result = await single_flight.do(flight_key, compute, redis_client, lambda: read_cached_search(redis_client, cache_key, with_facets))
+        return search_response(*result)
+
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail=f"Search failed: {e}")
+
+async def read_cached_search(redis_client, cache_key: str, with_facets: bool = False):
+    total_count, hits_body, facets_body = await redis_client.hmget(cache_key, ["total_count", "hits", "facets"])
+    if hits_body is None or (with_facets and facets_body is None):
+        return None
+    return int(total_count), hits_body, facets_body if with_facets else None
+
+def with_facets_body(hits_body, facets_body) -> bytes:
+    """
+    {"hits": [...], "facets": {...}} assembled from the stored JSON without reparsing it.
+    """
+    if isinstance(hits_body, str):
+        hits_body = hits_body.encode("utf-8")
+    if isinstance(facets_body, str):
+        facets_body = facets_body.encode("utf-8")
+    return b'{"hits":' + hits_body + b',"facets":' + (facets_body or b"null") + b"}"
+
+def search_response(total_count: int, hits_body, facets_body=None) -> Response:
+    """
+    The hits list, or an object with hits and facets when facets were requested.
+    """
+    content = hits_body if facets_body is None else with_facets_body(hits_body, facets_body)
+    return Response(content=content, media_type="application/json", headers={"x-total-count": str(total_count)})
+
+async def search_with_cursor(response: Response, params: dict, es_client):
+    """
+    Paginate with a point-in-time and search_after. The opaque cursor returned in
+    x-next-cursor carries the PIT id, sort values, position and total count, so
+    follow-up pages skip counting and deep pages stay as cheap as the first one.
+    """
+    fingerprint = search_fingerprint({k: v for k, v in params.items() if k not in ("cursor", "page", "facets")})
+
+    try:
+        if params["cursor"] == FIRST_CURSOR:
+            pit = await es_client.open_point_in_time(index=INDEX, keep_alive=PIT_KEEP_ALIVE)
+            state = {"pit": pit["id"], "search_after": None, "position": 0, "total_count": None}
+        else:
+            state = decode_cursor(params["cursor"], fingerprint)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail=f"Search failed: {e}")
 
+    # Facets describe the whole result set, they are computed with the first page only
+    first_page = params["cursor"] == FIRST_CURSOR
+    body = faceted_search_body(params) if params["facets"] and first_page else {"query": build_search_query(params)}
+    body = {
+        **body,
+        "size": params["limit"],
+        "pit": {"id": state["pit"], "keep_alive": PIT_KEEP_ALIVE},
+        "sort": CURSOR_SORT,
+        "track_total_hits": state["total_count"] is None,
+        "_source": search_source_fields()
+    }
+    if state["search_after"]:
+        body["search_after"] = state["search_after"]
+
+    try:
+        es_response = await es_client.search(body=body)
+    except NotFoundError:
+        raise HTTPException(status_code=410, detail="Cursor expired, restart with cursor=*")
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=f"Search failed: {e}")
 
+    total_count = state["total_count"]
+    if total_count is None:
+        total_count = es_response["hits"]["total"]["value"]
+
+    hits = []
+    es_hits = es_response["hits"]["hits"]
+    for i, hit in enumerate(es_hits, start=1 + state["position"]):
+        source = hit["_source"]
+        hits.append({
+            "id": i,
+            "app_id": source.get("app_id"),
+            "name": hit_name(source),
+            "package_name": source.get("package_name")
+        })
+
+    pit_id = es_response.get("pit_id", state["pit"])
+    position = state["position"] + len(hits)
+    if len(es_hits) == params["limit"] and position < total_count:
+        response.headers["x-next-cursor"] = encode_cursor(pit_id, es_hits[-1]["sort"], position, total_count, fingerprint)
+    else:
+        # Last page, release the point-in-time instead of waiting for keep_alive
+        try:
+            await es_client.close_point_in_time(id=pit_id)
+        except Exception as e:
+            print(e)
+
+    response.headers["x-total-count"] = str(total_count)
+    if params["facets"]:
+        facets_body = json_body(parse_facets(es_response["aggregations"])) if first_page else None
+        return Response(content=with_facets_body(json_body(hits), facets_body), media_type="application/json", headers=dict(response.headers))
+    return Response(content=json_body(hits), media_type="application/json", headers=dict(response.headers))
+
+@router.get("/suggest", response_model=List[dict])
+async def suggest_apps(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=20),
+    es_client = Depends(get_elasticsearch_async)
+):
+    """
+    Autocomplete on app and package names for the search box, served from the
+    completion field so each keystroke costs one in-memory lookup in ES.
+    """
+    prefix = " ".join(q.split()).lower()
+    if not prefix:
+        return Response(content=b"[]", media_type="application/json")
+    cache_key = f"{limit}:{prefix}"
+
+    entry = suggest_l1.get(cache_key)
+    if entry is None:
+        try:
+            # A late suggestion is useless, the user has typed on: no retries, short timeout
+            es_response = await es_client.options(request_timeout=1, max_retries=0).search(index=INDEX, body=suggest_body(prefix, limit))
+        except Exception as e:
+            print(e)
+            raise HTTPException(status_code=500, detail=f"Suggest failed: {e}")
+        entry = cache_entry(json_body(parse_suggestions(es_response)))
+        suggest_l1.set(cache_key, entry)
+
+    return cached_json_response(request, entry, SUGGEST_CACHE_CONTROL)
+
+@router.get("/cache/stats", dependencies=[Depends(get_admin_user)])
+async def get_cache_stats():
+    return cache_stats()
+
+@router.get("/health")
+async def get_health():
+    # Public, for load balancers: the status code only
+    healthy = all(dependency["healthy"] for dependency in health_supervisor.snapshot().values())
+    return Response(status_code=200 if healthy else 503)
+
+@router.get("/health/details", dependencies=[Depends(get_admin_user)])
+async def get_health_details():
+    status = health_supervisor.snapshot()
+    healthy = all(dependency["healthy"] for dependency in status.values())
+    status["download_log"] = download_log_writer.stats()
+    return JSONResponse(status, status_code=200 if healthy else 503)
+
+async def read_cached_body(redis_client, cache_key: str):
+    return await redis_client.get(cache_key)
+
 def serialize_result(result):
     # Convert Record to dictionary
     result_dict = dict(result)
@@ -457,9 +457,98 @@ def serialize_result(result):
             result_dict[key] = value.isoformat()  # Convert datetime to ISO format string
     return result_dict
 
+def app_details_query(app_ids: List[int]):
+    """
+    Details query for one or more apps, grouped per description, name and developer.
+    """
+    md = model_description.alias("md")
+    ma = model_app.alias("ma")
+    mdev = model_developer.alias("mdev")
+    mca = model_category_apps__model_app_categories.alias("mca")
+    mc = model_category.alias("mc")
+    mn = model_name.alias("mn")
+
+    return (
+        select(
+            md.c.id,
+            mn.c.name,
+            md.c.text,
+            md.c.created_on,
+            md.c.app_id,
+            mdev.c.developer_id,
+            ma.c.app_id.label("package_name"),
+            func.group_concat(mc.c.name).label("categories")
+        )
+        .select_from(
+            md.join(ma, md.c.app_id == ma.c.id)
+            .join(mdev, ma.c.developer_id == mdev.c.id)
+            .join(mca, ma.c.id == mca.c.model_app_id)
+            .join(mc, mca.c.model_category_id == mc.c.id)
+            .join(mn, md.c.app_id == mn.c.app_id)
+        )
+        .where(md.c.app_id.in_(app_ids))
+        .group_by(md.c.id, md.c.text, md.c.created_on, md.c.app_id, mdev.c.developer_id, mn.c.name, ma.c.app_id)
+    )
+
+def build_app_details(row) -> dict:
+    result = serialize_result(row)
+    result["categories"] = result["categories"].split(",") if result["categories"] else []
+    result["maturity"] = [category for category in result["categories"] if reference_data.is_maturity(category)]
+    result["categories"] = [category for category in result["categories"] if not reference_data.is_maturity(category)]
+    return result
+
+def summary_to_details(row) -> dict:
+    return serialize_result({
+        "id": row["description_id"],
+        "text": row["text"],
+        "name": row["name"],
+        "package_name": row["package_name"],
+        "created_on": row["created_on"],
+        "app_id": row["app_id"],
+        "developer_id": row["developer_id"],
+        "categories": row["categories"].split(",") if row["categories"] else [],
+        "maturity": row["maturity"].split(",") if row["maturity"] else [],
+    })
+
+async def fetch_app_details(database: Database, app_ids: List[int]) -> dict:
+    """
+    Details keyed by app id. Reads the app_summary read model by primary key and
+    falls back to the multi-join query for apps not summarized yet.
+    """
+    details = {}
+    rows = await database.fetch_all(select(app_summary).where(app_summary.c.app_id.in_(app_ids)))
+    for row in rows:
+        details[row["app_id"]] = summary_to_details(row)
+
+    missing = [app_id for app_id in app_ids if app_id not in details]
+    if missing:
+        for row in await database.fetch_all(app_details_query(missing)):
+            # One row per app, as with the summary
+            if row["app_id"] not in details:
+                details[row["app_id"]] = build_app_details(row)
+    return details
+
+async def load_app_details(app_id: int, cache_key: str, database: Database, redis_client):
+    """
+    Build the details payload for an app from the database and cache it.
+    """
+    result = (await fetch_app_details(database, [app_id])).get(app_id)
+
+    if not result:
+        raise HTTPException(status_code=404, detail="Details not found")
+
+    # Validate once here, the cached bytes are served as-is afterwards
+    body = json_body(AppDetails(**result).model_dump())
+
+    # Cache the result in Redis with an expiration time (e.g., 1 hour)
+    await redis_client.set(cache_key, body, ex=cache_expiration)
+
+    return body
+
 @router.get("/details/{app_id}", response_model=AppDetails)
 async def fetchDetails(
     app_id: int, 
+    request: Request,
     database: Database = Depends(get_database), 
     redis_client = Depends(get_redis)  # Redis client for caching
 ):
@@ -468,67 +557,200 @@ async def fetchDetails(
     # Generate a unique cache key for the app_id
     cache_key = f"details:{app_id}"
 
+    # Hot apps are served from process memory without a Redis round trip
+    entry = details_l1.get(cache_key)
+    if entry is not None:
+        return cached_json_response(request, entry, DETAILS_CACHE_CONTROL)
+
     try:
         # Check if the details are cached
-        cached_result = await redis_client.get(cache_key)
-        if cached_result:
-            # Return the cached result if available
+        body = await redis_client.get(cache_key)
+        if body:
+            # Return the cached bytes if available, no parsing involved
             await redis_client.expire(cache_key, cache_expiration)
-            return json.loads(cached_result)
-
-        # Query database for app details
-        md = model_description.alias("md")
-        ma = model_app.alias("ma")
-        mdev = model_developer.alias("mdev")
-        mca = model_category_apps__model_app_categories.alias("mca")
-        mc = model_category.alias("mc")
-        mn = model_name.alias("mn")
-
-        query_stmt = (
-            select(
-                md.c.id,
-                mn.c.name,
-                md.c.text,
-                md.c.created_on,
-                md.c.app_id,
-                mdev.c.developer_id,
-                ma.c.app_id.label("package_name"),
-                func.group_concat(mc.c.name).label("categories")
-            )
-            .select_from(
-                md.join(ma, md.c.app_id == ma.c.id)
-                .join(mdev, ma.c.developer_id == mdev.c.id)
-                .join(mca, ma.c.id == mca.c.model_app_id)
-                .join(mc, mca.c.model_category_id == mc.c.id)
-                .join(mn, md.c.app_id == mn.c.app_id)
+        else:
+            # Concurrent misses for the same app share one database query
+            body = await single_flight.do(
+                cache_key,
+                lambda: load_app_details(app_id, cache_key, database, redis_client),
+                redis_client,
+                lambda: read_cached_body(redis_client, cache_key)
             )
-            .where(md.c.app_id == app_id)
-            .group_by(md.c.id, md.c.text, md.c.created_on, md.c.app_id, mdev.c.developer_id, mn.c.name, ma.c.app_id)
-        )
-        
-        result = await database.fetch_one(query_stmt)
-        
-        if not result:
-            raise HTTPException(status_code=404, detail="Details not found")
-        
-        # Process the result
-        result = serialize_result(result)
-        result["categories"] = result["categories"].split(",") if result["categories"] else []
-        result["maturity"] = [category for category in result["categories"] if category in MATURITY]
-        result["categories"] = [category for category in result["categories"] if category not in MATURITY]
 
-        # Cache the result in Redis with an expiration time (e.g., 1 hour)
-        await redis_client.set(cache_key, json.dumps(result), ex=cache_expiration)
+        entry = cache_entry(body)
+        details_l1.set(cache_key, entry)
+        return cached_json_response(request, entry, DETAILS_CACHE_CONTROL)
+
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail=f"Fetching details failed: {e}")
 
-        return result
+MAX_BATCH_DETAILS = 100
 
+def parse_app_ids(ids: str) -> List[int]:
+    try:
+        app_ids = list(dict.fromkeys(int(app_id) for app_id in ids.split(",") if app_id.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+    if not app_ids or any(app_id <= 0 for app_id in app_ids):
+        raise HTTPException(status_code=400, detail="Invalid app_id")
+    if len(app_ids) > MAX_BATCH_DETAILS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_DETAILS} ids per request")
+    return app_ids
+
+@router.get("/details", response_model=List[AppDetails])
+async def fetchDetailsBatch(
+    ids: str = Query(..., description="Comma separated app ids"),
+    database: Database = Depends(get_database),
+    redis_client = Depends(get_redis)
+):
+    """
+    Details for a page of apps in one call: L1, then one MGET, then one summary
+    lookup for whatever is still missing, written back with one pipeline.
+    Unknown ids are omitted, results keep the requested order.
+    """
+    app_ids = parse_app_ids(ids)
+    bodies = {}
+
+    for app_id in app_ids:
+        entry = details_l1.get(f"details:{app_id}")
+        if entry is not None:
+            bodies[app_id] = entry[0]
+
+    try:
+        missing = [app_id for app_id in app_ids if app_id not in bodies]
+        if missing:
+            cached_results = await redis_client.mget([f"details:{app_id}" for app_id in missing])
+            for app_id, cached_result in zip(missing, cached_results):
+                if cached_result:
+                    bodies[app_id] = cached_result.encode("utf-8")
+                    details_l1.set(f"details:{app_id}", cache_entry(bodies[app_id]))
+
+        missing = [app_id for app_id in app_ids if app_id not in bodies]
+        if missing:
+            loaded = await fetch_app_details(database, missing)
+
+            if loaded:
+                pipe = redis_client.pipeline(transaction=False)
+                for app_id, result in loaded.items():
+                    bodies[app_id] = json_body(AppDetails(**result).model_dump())
+                    details_l1.set(f"details:{app_id}", cache_entry(bodies[app_id]))
+                    pipe.set(f"details:{app_id}", bodies[app_id], ex=cache_expiration)
+                await pipe.execute()
+
+        # Each entry is already a JSON object, the list is assembled without reparsing
+        body = b"[" + b",".join(bodies[app_id] for app_id in app_ids if app_id in bodies) + b"]"
+        return Response(content=body, media_type="application/json")
+
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=f"Fetching details failed: {e}")
 
+def compute_rating(rating_row) -> dict:
+    if rating_row is None:
+        return {"total_ratings": 0, "rating": 0}
+    number_of_ratings = rating_row["number_of_ratings"]
+    stars = [rating_row["one_star_ratings"], rating_row["two_star_ratings"], rating_row["three_star_ratings"], rating_row["four_star_ratings"], rating_row["five_star_ratings"]]
+    return {
+        "total_ratings": number_of_ratings if number_of_ratings is not None else 0,
+        "rating": round(sum((i + 1) * r for i, r in enumerate(stars)) / number_of_ratings, 2) if number_of_ratings is not None and number_of_ratings != 0 else 0,
+    }
+
+async def load_version_details(app_id: int, cache_key: str, database: Database, redis_client):
+    """
+    Build the version list for an app from the database and cache it.
+
+    Downloads, permissions, SDK versions and ratings are fetched as separate keyed
+    queries and merged here. Joining them in one statement multiplied the rows
+    (permissions x requested permissions x ratings per download).
+    """
+    md = model_download.alias("md")
+    mv = model_version.alias("mv")
+    ma = model_androidmanifest.alias("ma")
+
+    # Step 1: downloads of the app with their version
+    downloads_query = (
+        select(md.c.id, md.c.hash, md.c.size, md.c.created_on, mv.c.version)
+        .select_from(md.join(mv, md.c.version_id == mv.c.id))
+        .where(md.c.app_id == app_id)
+        .order_by(md.c.created_on.desc())
+    )
+    downloads = await database.fetch_all(downloads_query)
+
+    if not downloads:
+        raise HTTPException(status_code=404, detail="No matching records found")
+
+    download_ids = [row["id"] for row in downloads]
+    permissions = {download_id: set() for download_id in download_ids}
+
+    # Step 2: permissions from both sources, deduplicated SQL-side
+    app_permissions_query = (
+        select(model_app_permissions.c.download_id, model_app_permissions.c.name)
+        .where(model_app_permissions.c.download_id.in_(download_ids))
+        .distinct()
+    )
+    requested_permissions_query = (
+        select(ma.c.download_id, model_permissionrequested.c.name)
+        .select_from(ma.join(model_permissionrequested, ma.c.id == model_permissionrequested.c.manifest_id))
+        .where(ma.c.download_id.in_(download_ids))
+        .distinct()
+    )
+    for query in (app_permissions_query, requested_permissions_query):
+        for row in await database.fetch_all(query):
+            if row["name"]:
+                permissions[row["download_id"]].add(row["name"])
+
+    # Step 3: SDK versions via the manifest, first one per download
+    sdk_query = (
+        select(ma.c.download_id, model_sdkversion.c.min_sdk_number, model_sdkversion.c.target_sdk_number)
+        .select_from(ma.join(model_sdkversion, ma.c.id == model_sdkversion.c.manifest_id))
+        .where(ma.c.download_id.in_(download_ids))
+    )
+    sdk_versions = {}
+    for row in await database.fetch_all(sdk_query):
+        sdk_versions.setdefault(row["download_id"], row)
+
+    # Step 4: ratings of the app, matched to downloads by year in memory (latest snapshot per year)
+    ratings_query = (
+        select(model_rating)
+        .where(model_rating.c.app_id == app_id)
+        .order_by(model_rating.c.created_on.desc())
+    )
+    ratings_by_year = {}
+    for row in await database.fetch_all(ratings_query):
+        if row["created_on"] is not None:
+            ratings_by_year.setdefault(row["created_on"].year, row)
+
+    version_details = []
+    for row in downloads:
+        sdk = sdk_versions.get(row["id"])
+        min_sdk = sdk["min_sdk_number"] if sdk else None
+        target_sdk = sdk["target_sdk_number"] if sdk else None
+        rating = compute_rating(ratings_by_year.get(row["created_on"].year) if row["created_on"] else None)
+
+        version_details.append(VersionDetails(
+            hash=row["hash"],
+            size=row["size"],
+            version=row["version"],
+            created_on=row["created_on"],
+            permissions=list(permissions[row["id"]]),
+            total_ratings=rating["total_ratings"],
+            rating=rating["rating"],
+            min_sdk=min_sdk if min_sdk is not None and 1 <= min_sdk <= 35 else None,
+            target_sdk=target_sdk if target_sdk is not None and 1 <= target_sdk <= 35 and target_sdk >= min_sdk else None
+        ))
+
+    body = json_body([detail.model_dump() for detail in version_details])
+    await redis_client.set(cache_key, body, ex=cache_expiration)
+
+    return body
+
 @router.get("/version-details/{app_id}", response_model=List[VersionDetails])
 async def get_version_details(
     app_id: int, 
+    request: Request,
     database: Database = Depends(get_database), 
     redis_client = Depends(get_redis)  # Redis client for caching
 ):
@@ -537,201 +759,44 @@ async def get_version_details(
     # Generate a unique cache key for the app_id
     cache_key = f"version-details:{app_id}"
 
+    # Hot apps are served from process memory without a Redis round trip
+    entry = version_details_l1.get(cache_key)
+    if entry is not None:
+        return cached_json_response(request, entry, DETAILS_CACHE_CONTROL)
+
     try:
         # Check if the version details are cached
-        cached_result = await redis_client.get(cache_key)
-        if cached_result:
-            # Return the cached result if available
+        body = await redis_client.get(cache_key)
+        if body:
+            # Return the cached bytes if available, no parsing involved
             await redis_client.expire(cache_key, cache_expiration)
-            return json.loads(cached_result)
-
-        # Aliases for the tables
-        md = model_download.alias("md")
-        mv = model_version.alias("mv")
-        permissions_1 = model_app_permissions.alias("permissions_1")
-        permissions_2 = model_permissionrequested.alias("permissions_2")
-        ma = model_androidmanifest.alias("ma")
-        mr = model_rating.alias("mr")
-        sdk = model_sdkversion.alias("sdk")
-
-        # Construct the query
-        query_stmt = (
-            select(
-                md.c.id,
-                md.c.hash, 
-                md.c.size, 
-                md.c.created_on, 
-                mv.c.version, 
-                permissions_1.c.name.label("permission_1"),
-                permissions_2.c.name.label("permission_2"),
-                mr.c.number_of_ratings,
-                mr.c.one_star_ratings,
-                mr.c.two_star_ratings,
-                mr.c.three_star_ratings,
-                mr.c.four_star_ratings,
-                mr.c.five_star_ratings,
-                sdk.c.min_sdk_number,
-                sdk.c.target_sdk_number
-            )
-            .select_from(
-                md
-                .join(mv, md.c.version_id == mv.c.id)
-                .outerjoin(permissions_1, md.c.id == permissions_1.c.download_id)
-                .outerjoin(ma, md.c.id == ma.c.download_id)
-                .outerjoin(permissions_2, ma.c.id == permissions_2.c.manifest_id)
-                .outerjoin(sdk, ma.c.id == sdk.c.manifest_id)
-                .outerjoin(
-                    mr,
-                    (md.c.app_id == mr.c.app_id) &
-                    (extract('year', md.c.created_on) == extract('year', mr.c.created_on))
-                )
+        else:
+            # Concurrent misses for the same app share one database query
+            body = await single_flight.do(
+                cache_key,
+                lambda: load_version_details(app_id, cache_key, database, redis_client),
+                redis_client,
+                lambda: read_cached_body(redis_client, cache_key)
             )
-            .where(md.c.app_id == app_id)
-            .order_by(md.c.created_on.desc()) 
-        )
 
-        # Execute the query
-        results = await database.fetch_all(query_stmt)
-        
-        if not results:
-            raise HTTPException(status_code=404, detail="No matching records found")
-
-        download_details = {}
-        
-        for row in results:
-            download_id = row["id"]
-            hash_value = row["hash"]
-            size = row["size"]
-            created_on = row["created_on"]
-            version = row["version"]
-            permission_1 = row["permission_1"]
-            permission_2 = row["permission_2"]
-            number_of_ratings = row["number_of_ratings"]
-            one_star_ratings = row["one_star_ratings"]
-            two_star_ratings = row["two_star_ratings"]
-            three_star_ratings = row["three_star_ratings"]
-            four_star_ratings = row["four_star_ratings"]
-            five_star_ratings = row["five_star_ratings"]
-            min_sdk = row["min_sdk_number"]
-            target_sdk = row["target_sdk_number"]
-            
-            if download_id not in download_details:
-                download_details[download_id] = {
-                    "hash": hash_value,
-                    "size": size,
-                    "created_on": created_on,
-                    "version": version,
-                    "permissions": set(),
-                    "total_ratings": number_of_ratings if number_of_ratings is not None else 0,
-                    "rating": round(sum((i + 1) * r for i, r in enumerate([one_star_ratings, two_star_ratings, three_star_ratings, four_star_ratings, five_star_ratings])) / number_of_ratings, 2) if number_of_ratings is not None and number_of_ratings != 0 else 0,
-                    "min_sdk": min_sdk if min_sdk is not None and 1 <= min_sdk <= 35 else None,
-                    "target_sdk": target_sdk if target_sdk is not None and 1 <= target_sdk <= 35 and target_sdk >= min_sdk else None,
-                }
-            
-            if permission_1:
-                download_details[download_id]["permissions"].add(permission_1)
-            if permission_2:
-                download_details[download_id]["permissions"].add(permission_2)
-
-        version_details = [
-            VersionDetails(
-                hash=details["hash"],
-                size=details["size"],
-                version=details["version"],
-                created_on=details["created_on"],
-                permissions=list(details["permissions"]),
-                total_ratings=details["total_ratings"],
-                rating=details["rating"],
-                min_sdk=details["min_sdk"],
-                target_sdk=details["target_sdk"]
-            )
-            for details in download_details.values()
-        ]
-
-        serialized_data = [serialize_result(detail.dict()) for detail in version_details]
-        await redis_client.set(cache_key, json.dumps(serialized_data), ex=cache_expiration)
-
-        return version_details
+        entry = cache_entry(body)
+        version_details_l1.set(cache_key, entry)
+        return cached_json_response(request, entry, DETAILS_CACHE_CONTROL)
 
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=f"Fetching version details failed: {e}")
 
 @router.get("/categories", response_model=List[str])
-async def get_categories(database: Database = Depends(get_database)):
-    redis_client = get_redis()
-    cache_key = "categories"
-
-    # Try to get the categories from Redis cache
-    cached_categories = await redis_client.get(cache_key)
-    
-    if cached_categories:
-        # If categories are found in cache, return them
-        return json.loads(cached_categories)
-
-    # If not found in cache, fetch from database
-    query = select(model_category.c.name)
-    results = await database.fetch_all(query)
-    
-    if not results:
+async def get_categories(request: Request):
+    # Served from the reference data registry, loaded at startup and refreshed in the background
+    if not reference_data.categories:
         raise HTTPException(status_code=404, detail="No categories found")
-
-    unique_categories = list(set([result['name'] for result in results]))
-    categories = [category for category in unique_categories if category not in MATURITY]
-
-    await redis_client.set(cache_key, json.dumps(categories))
-
-    return categories
+    return cached_json_response(request, reference_data.categories_entry, REFERENCE_CACHE_CONTROL)
 
 @router.get("/maturity", response_model=List[str])
-async def get_maturity():
-    return MATURITY
-
-# Base directories to search for the file
-ALLOWED_BASE_DIRS = [
-    "/Volumes/apks",
-    "/Volumes/apks/2018",
-    "/Volumes/apks/old_apks"
-]
-
-def sanitize_file_path(hash_value: str) -> str:
-    """
-    Sanitize the hash_value to ensure it cannot traverse directories.
-    """
-    return os.path.basename(hash_value)  # Ensure only the base name is used
-
-
-def validate_file_path(file_path: str) -> bool:
-    """
-    Ensure the file path is within the allowed base directories.
-    """
-    for base_dir in ALLOWED_BASE_DIRS:
-        if os.path.commonpath([base_dir, file_path]) == base_dir:
-            return True
-    return False
-
-def find_file_path(hash_value: str) -> str:
-    """
-    Search for the file in the allowed directories and validate the path.
-    """
-    # Sanitize the hash_value
-    sanitized_hash = sanitize_file_path(hash_value)
-
-    # Construct possible paths and validate
-    for base_dir in ALLOWED_BASE_DIRS:
-        file_path = os.path.join(
-            base_dir,
-            sanitized_hash[:1],
-            sanitized_hash[1:2],
-            sanitized_hash[2:3],
-            sanitized_hash[3:4],
-            sanitized_hash[4:5],
-            sanitized_hash[5:6],
-            sanitized_hash
-        )
-        if validate_file_path(file_path) and os.path.exists(file_path):
-            return file_path
-    raise FileNotFoundError("File not found.")
+async def get_maturity(request: Request):
+    return cached_json_response(request, reference_data.maturity_entry, REFERENCE_CACHE_CONTROL)
 
 async def get_package_name(hash_value: str, database) -> str:
     """
@@ -774,58 +839,32 @@ def create_presigned_url(hash_value: str, package_name: str, expires_delta: time
     presigned_url = f"/api/download/{hash_value}?token={token}"
     return presigned_url
 
-async def is_rate_limited(user_email: str) -> bool:
-    key = f"download_rate:{user_email}"
-    redis_client = get_redis()
-    current_downloads = await redis_client.get(key)
-
-    if current_downloads and int(current_downloads) >= 10:
-        return True
-    else:
-        await redis_client.incr(key)
-        await redis_client.expire(key, 3600)  # Reset the counter every hour
-        return False
-    
-async def log_download_activity(user_email: str, hash_value: str, request: Request, database):
+def log_download_activity(user_email: str, hash_value: str, request: Request):
     """
     Log the download activity with the user's email, hash, user-agent, and IP address.
+    Rows are buffered and written in batches by the download log writer.
     """
-    try: 
-        user_agent = request.headers.get('user-agent', 'Unknown')
-        ip_address = request.headers.get('x-forwarded-for', request.client.host)
-
-        log_data = {
-            "email": user_email,
-            "hash": hash_value,
-            "user_agent": user_agent,
-            "ip_address": ip_address,
-        }
-        
-        query = insert(download_log).values(**log_data)
-        await database.execute(query)
-    
-    except MySQLError as db_error:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    user_agent = request.headers.get('user-agent', 'Unknown')
+    ip_address = request.headers.get('x-forwarded-for', request.client.host)
+    log_download(user_email, hash_value, user_agent, ip_address)
 
 @router.get("/generate-download-url/{hash_value}")
 async def generate_download_url(hash_value: str, request: Request, user: dict = Depends(get_current_user), database: Database = Depends(get_database)):
     try:
         # Check for rate limiting
-        if await is_rate_limited(user["email"]):
-            raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again after an hour!")
+        limit = await rate_limiter.hit(get_redis(), "download", user["email"])
+        if not limit.allowed:
+            raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Try again in {limit.retry_after} seconds!", headers={"Retry-After": str(limit.retry_after)})
         
         # Check if the file exists in one of the specified directories
-        find_file_path(hash_value)
+        await find_file_path(hash_value)
 
         package_name = await get_package_name(hash_value, database)
 
         # Generate a pre-signed URL with a token
         presigned_url = create_presigned_url(hash_value, package_name, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
 
-        await log_download_activity(user["email"], hash_value, request, database)
+        log_download_activity(user["email"], hash_value, request)
 
         return JSONResponse({"url": presigned_url})
     
@@ -838,7 +877,7 @@ async def generate_download_url(hash_value: str, request: Request, user: dict =
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/download/{hash_value}")
-async def download_file(hash_value: str, token: str):
+async def download_file(hash_value: str, token: str, request: Request):
     try:
         # Decode the token
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -848,17 +887,15 @@ async def download_file(hash_value: str, token: str):
         package_name = payload["package_name"] if payload["package_name"] else ""
             
         # Verify the file's existence again (defensive check)
-        file_path = find_file_path(hash_value)
+        file_path = await find_file_path(hash_value)
     
-        def file_generator():
-            with open(file_path, "rb") as f:
-                while chunk := f.read(1024 * 1024):
-                    yield chunk
-
-        # Serve the file from the identified path
-        return StreamingResponse(file_generator(), media_type='application/octet-stream', headers={
-            'Content-Disposition': f'attachment; filename="{package_name}-{hash_value}.apk"'
-        })
+        # Serve the file from the identified path, honouring Range so interrupted downloads can resume
+        return RangeFileResponse(
+            file_path,
+            range_header=request.headers.get("range"),
+            filename=f"{package_name}-{hash_value}.apk",
+            media_type='application/octet-stream'
+        )
 
     except HTTPException as http_exc:
         raise http_exc
@@ -871,9 +908,6 @@ async def download_file(hash_value: str, token: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# BATCH_SIZE = 1000  # Adjust as needed
-# NUM_WORKERS = 10  # Number of concurrent workers
-
 # @router.delete("/admin/_index")
 # async def delete_index(index_name: str):
 #     """
@@ -900,393 +934,6 @@ async def download_file(hash_value: str, token: str):
 #     if await es_client.indices.exists(index=index_name):
 #         raise HTTPException(status_code=400, detail=f"Index '{index_name}' already exists.")
 
-#     # Define the index mapping with expanded fields
-#     index_body = {
-#         "mappings": {
-#             "properties": {
-#             "app_id": { "type": "keyword" },
-#             "package_name": {
-#                 "type": "text",
-#                 "fields": {
-#                 "raw": {
-#                     "type": "keyword"
-#                 }
-#                 }
-#             },
-#             "developer_name": { "type": "text" },
-#             "categories": { "type": "keyword" },
-#             "names": {
-#                 "type": "nested",
-#                 "properties": {
-#                 "name": { "type": "text", "fields": { "keyword": { "type": "keyword" } } },
-#                 "created_on": { "type": "date" }
-#                 }
-#             },
-#             "descriptions": {
-#                 "type": "nested",
-#                 "properties": {
-#                 "description": { "type": "text" },
-#                 "created_on": { "type": "date" }
-#                 }
-#             },
-#             "versions": {
-#                 "type": "nested",
-#                 "properties": {
-#                 "id": { "type": "keyword" },
-#                 "permissions": {
-#                     "type": "text",
-#                     "fields": {
-#                     "raw": {
-#                         "type": "keyword"
-#                     }
-#                     }
-#                 }
-#                 }
-#             }
-#             }
-#         }
-#     }
-
-#     # Create the index
-#     await es_client.indices.create(index=index_name, body=index_body)
-#     print(f"Created index: {index_name}")
+#     # Mapping lives in index_mapping.py (versioned)
+#     await index_mapping.create_index(es_client, index_name)
 #     return {"index_name": index_name}
-
-# @router.post("/admin/fill_index")
-# async def fill_index(response: Response, background_tasks: BackgroundTasks, index_name: str = Query(..., description="Name of the index to fill with data")):
-#     """
-#     Fills the specified index with data in the background. If the index does not exist, the request fails.
-#     """
-#     es_client = get_elasticsearch_async()
-    
-#     # Check if the index exists
-#     if not await es_client.indices.exists(index=index_name):
-#         raise HTTPException(status_code=404, detail=f"Index '{index_name}' does not exist.")
-
-#     # Start filling the index in the background
-#     background_tasks.add_task(fill_index_task, index_name)
-#     response.status_code = 202  # Accepted
-#     return {"status": f"Indexing started for index '{index_name}' in the background."}
-
-# async def fetch_batch(offset, db, index_name):
-#     # Step 1: Fetch app IDs and package names in batch
-#     app_query = select(model_app.c.id.label("app_id"), model_app.c.app_id.label("package_name")).limit(BATCH_SIZE).offset(offset)
-#     apps = await db.fetch_all(app_query)
-    
-#     if not apps:
-#         return None  # No more data to process
-    
-#     app_ids = [app["app_id"] for app in apps]
-#     app_data = {app["app_id"]: {"package_name": app["package_name"], "names": [], "descriptions": []} for app in apps}
-
-#     # Step 2: Fetch names for the batch of app IDs
-#     name_query = select(model_name.c.app_id, model_name.c.name, model_name.c.created_on).where(model_name.c.app_id.in_(app_ids))
-#     names = await db.fetch_all(name_query)
-    
-#     for row in names:
-#         app_data[row["app_id"]]["names"].append({
-#             "name": row["name"],
-#             "created_on": row["created_on"].strftime("%Y-%m-%d") if row["created_on"] else None
-#         })
-
-#     # Step 3: Fetch descriptions for the batch of app IDs
-#     description_query = select(model_description.c.app_id, model_description.c.text.label("description"), model_description.c.created_on).where(model_description.c.app_id.in_(app_ids))
-#     descriptions = await db.fetch_all(description_query)
-    
-#     for row in descriptions:
-#         app_data[row["app_id"]]["descriptions"].append({
-#             "description": row["description"],
-#             "created_on": row["created_on"].strftime("%Y-%m-%d") if row["created_on"] else None
-#         })
-
-#     # Prepare documents for bulk indexing
-#     actions = [
-#         {
-#             "_index": index_name,
-#             "_id": app_id,
-#             "_source": {
-#                 "app_id": app_id,
-#                 "package_name": data["package_name"],
-#                 "names": data["names"],
-#                 "descriptions": data["descriptions"]
-#             }
-#         }
-#         for app_id, data in app_data.items()
-#     ]
-    
-#     return actions
-
-# async def fetch_batch_all_data(offset, db, index_name, worker_id):
-#     # # Step 1: Fetch a limited set of IDs based on the offset to ensure the batch is within bounds
-#     # id_query = """
-#     # SELECT id FROM model_app ORDER BY id LIMIT :limit OFFSET :offset
-#     # """
-#     # limited_app_ids = await db.fetch_all(query=id_query, values={"limit": BATCH_SIZE, "offset": offset})
-#     # #print(f'Worker {worker_id}: Finished step 1')
-#     # # Check if there are any IDs to process
-#     # if not limited_app_ids:
-#     #     print(f"No records found for offset {offset}. Ending this worker's task.")
-#     #     return None  # No more data to process for this worker
-
-#     # # Extract IDs as a tuple for use in the main query
-#     # app_ids = tuple(row["id"] for row in limited_app_ids)
-
-#     # # Step 2: Main data fetching query with a JOIN to limited_app_ids
-#     # main_query = """
-#     # SELECT 
-#     #     ma.id AS app_id, 
-#     #     ma.app_id AS package_name,
-#     #     md.developer_id AS developer_name,
-#     #     mn.name, mn.created_on AS name_date,
-#     #     dsc.text AS description, dsc.created_on AS description_date,
-#     #     mc.name AS category_name
-#     # FROM 
-#     #     model_app ma
-#     # JOIN 
-#     #     (SELECT id FROM model_app WHERE id IN :app_ids) AS limited_app_ids ON ma.id = limited_app_ids.id
-#     # JOIN 
-#     #     model_developer md ON ma.developer_id = md.id
-#     # LEFT JOIN 
-#     #     model_name mn ON mn.app_id = ma.id
-#     # LEFT JOIN 
-#     #     model_description dsc ON dsc.app_id = ma.id
-#     # LEFT JOIN 
-#     #     model_category_apps__model_app_categories mca ON mca.model_app_id = ma.id
-#     # LEFT JOIN 
-#     #     model_category mc ON mca.model_category_id = mc.id
-#     # """
-    
-#     # # Execute the main query
-#     # rows = await db.fetch_all(query=main_query, values={"app_ids": app_ids})
-#     #print(f'Worker {worker_id}: Finished step 2')
-#     combined_query = """
-#     SELECT 
-#         ma.id AS app_id, 
-#         ma.app_id AS package_name,
-#         md.developer_id AS developer_name,
-#         mn.name, mn.created_on AS name_date,
-#         dsc.text AS description, dsc.created_on AS description_date,
-#         mc.name AS category_name
-#     FROM 
-#         model_app ma
-#     JOIN 
-#         (SELECT id FROM model_app ORDER BY id LIMIT :limit OFFSET :offset) AS limited_app_ids
-#         ON ma.id = limited_app_ids.id
-#     JOIN 
-#         model_developer md ON ma.developer_id = md.id
-#     LEFT JOIN 
-#         model_name mn ON mn.app_id = ma.id
-#     LEFT JOIN 
-#         model_description dsc ON dsc.app_id = ma.id
-#     LEFT JOIN 
-#         model_category_apps__model_app_categories mca ON mca.model_app_id = ma.id
-#     LEFT JOIN 
-#         model_category mc ON mca.model_category_id = mc.id
-#     """
-#     rows = await db.fetch_all(query=combined_query, values={"limit": BATCH_SIZE, "offset": offset})
-
-#     # Step 3: Organize data by app_id for names, descriptions, categories, etc.
-#     app_data = {}
-#     for row in rows:
-#         app_id = row["app_id"]
-#         if app_id not in app_data:
-#             app_data[app_id] = {
-#                 "package_name": row["package_name"],
-#                 "developer_name": row["developer_name"],
-#                 "names": set(),
-#                 "descriptions": set(),
-#                 "categories": set(),
-#                 "versions": {}
-#             }
-
-#         if row["name"]:
-#             app_data[app_id]["names"].add((row["name"], row["name_date"].strftime("%Y-%m-%d") if row["name_date"] else None))
-#         if row["description"]:
-#             app_data[app_id]["descriptions"].add((row["description"], row["description_date"].strftime("%Y-%m-%d") if row["description_date"] else None))
-#         if row["category_name"]:
-#             app_data[row["app_id"]]["categories"].add(row["category_name"])
-
-#     # Step 4: Fetch versions for each app_id and associate permissions
-#     version_query = """
-#     SELECT 
-#         md.app_id AS app_id,
-#         md.id AS download_id,
-#         md.version_id AS version_id
-#     FROM 
-#         model_download md
-#     WHERE 
-#         md.app_id IN :app_ids
-#     """
-#     version_rows = await db.fetch_all(query=version_query, values={"app_ids": tuple(app_data.keys())})
-#     #print(f'Worker {worker_id}: Finished step 4')
-
-#     # Step 5: Initialize versions and retrieve permissions from both sources
-#     download_ids = [row["download_id"] for row in version_rows if row["download_id"]]
-#     for row in version_rows:
-#         app_id = row["app_id"]
-#         version_id = row["version_id"]
-#         if version_id not in app_data[app_id]["versions"]:
-#             app_data[app_id]["versions"][version_id] = {"id": version_id, "permissions": set()}
-
-#     # Fetch permissions using the first method
-#     permissions_query_1 = """
-#     SELECT 
-#         mpr.name AS permission_name,
-#         md.app_id,
-#         md.version_id AS version_id
-#     FROM model_permissionrequested mpr
-#     JOIN model_androidmanifest mv ON mv.id = mpr.manifest_id
-#     JOIN model_download md ON md.id = mv.download_id
-#     WHERE md.id IN :download_ids
-#     """
-#     # Only run the query if download_ids is not empty
-#     if download_ids:
-#         permissions_rows_1 = await db.fetch_all(query=permissions_query_1, values={"download_ids": tuple(download_ids)})
-#         #print(f'Worker {worker_id}: Finished step 5')
-#     else:
-#         #print(f'Worker {worker_id}: Skipping permissions query as download_ids is empty')
-#         permissions_rows_1 = []
-
-#     for row in permissions_rows_1:
-#         app_id = row["app_id"]
-#         version_id = row["version_id"]
-#         permission_name = row["permission_name"]
-#         if permission_name and app_id in app_data and version_id in app_data[app_id]["versions"]:
-#             app_data[app_id]["versions"][version_id]["permissions"].add(permission_name)
-
-#     # Fetch permissions using the second method
-#     permissions_query_2 = """
-#     SELECT 
-#         mp.name AS permission_name,
-#         md.app_id,
-#         md.version_id AS version_id
-#     FROM model_app_permissions mp
-#     JOIN model_download md ON md.id = mp.download_id
-#     WHERE md.id IN :download_ids
-#     """
-#     if download_ids:
-#         permissions_rows_2 = await db.fetch_all(query=permissions_query_2, values={"download_ids": tuple(download_ids)})
-#     else:
-#         permissions_rows_2 = []
-#     #print(f'Worker {worker_id}: Finished step 6')
-
-#     for row in permissions_rows_2:
-#         app_id = row["app_id"]
-#         version_id = row["version_id"]
-#         permission_name = row["permission_name"]
-#         if permission_name and app_id in app_data and version_id in app_data[app_id]["versions"]:
-#             app_data[app_id]["versions"][version_id]["permissions"].add(permission_name)
-
-#     # Step 5: Convert data structures for Elasticsearch and remove duplicates
-#     for data in app_data.values():
-#         data["names"] = [{"name": name, "created_on": date} for name, date in data["names"]]
-#         data["descriptions"] = [{"description": description, "created_on": date} for description, date in data["descriptions"]]
-#         data["categories"] = list(data["categories"])
-#         data["versions"] = [{"id": version_id, "permissions": list(version_data["permissions"])} for version_id, version_data in data["versions"].items()]
-
-#     # Prepare documents for bulk indexing
-#     actions = [
-#         {
-#             "_op_type": "index",
-#             "_index": index_name,
-#             "_id": app_id,
-#             "_source": {
-#                 "app_id": app_id,
-#                 "package_name": data["package_name"],
-#                 "developer_name": data["developer_name"],
-#                 "names": data["names"],
-#                 "descriptions": data["descriptions"],
-#                 "categories": data["categories"],
-#                 "versions": data["versions"]
-#             }
-#         }
-#         for app_id, data in app_data.items()
-#     ]
-    
-#     return actions
-
-# async def fetch_batch_with_retry(offset, db, index_name, worker_id, retries=3):
-#     for attempt in range(retries):
-#         try:
-#             return await fetch_batch_all_data(offset, db, index_name, worker_id)
-#         except Exception as e:
-#             if attempt < retries - 1:
-#                 print(f"******** Worker {worker_id}: Retrying fetch for offset {offset} (attempt {attempt + 1}) due to error: {e} **********")
-#                 await asyncio.sleep(2 ** attempt)  # Exponential backoff
-#             else:
-#                 print(f"******** Worker {worker_id}: Failed to fetch batch at offset {offset} after {retries} attempts: {e} **********")
-#                 raise e
-
-# async def retry_async_bulk(es_client, actions, worker_id, max_retries=3):
-#     """
-#     Retryable async_bulk helper for Elasticsearch.
-
-#     Args:
-#         es_client: The AsyncElasticsearch client.
-#         actions: The batch of actions to index.
-#         max_retries: Maximum number of retries.
-#         delay: Delay (in seconds) between retries.
-
-#     Returns:
-#         (success, failed): A tuple of successful and failed counts.
-#     """
-#     attempts = 0
-
-#     while attempts < max_retries:
-#         try:
-#             # Attempt the async_bulk operation
-#             success, failed = await helpers.async_bulk(es_client, actions, raise_on_error=False)
-#             #print(f"Bulk operation succeeded. Success: {success}, Failed: {failed}")
-#             return success, failed
-#         except Exception as e:
-#             attempts += 1
-#             if attempts < max_retries:
-#                 print(f"******** Worker {worker_id}: Retrying bulk op (attempt {attempts + 1}) due to error: {e} **********")
-#                 await asyncio.sleep(2 ** attempts)
-#             else:
-#                 print(f"******** Worker {worker_id}: Failed bulk op (attempt {attempts + 1}) due to error: {e} **********")
-#                 raise  # Re-raise the exception after max retries
-
-#     # Return 0 success and failed counts if all retries fail (optional fallback)
-#     return 0, len(actions)
-
-# async def worker(worker_id, db, es_client, index_name):
-#     offset = worker_id * BATCH_SIZE
-#     total_docs_indexed = 0
-#     worker_start_time = time.time()
-
-#     while True:
-#         batch_start_time = time.time()
-#         try:
-#             actions = await fetch_batch_with_retry(offset, db, index_name, worker_id)
-#             if not actions:
-#                 print(f"Worker {worker_id}: No more records. Finished processing.")
-#                 break
-
-#             # Bulk insert documents into Elasticsearch
-#             # success, failed = await helpers.async_bulk(es_client, actions, raise_on_error=False)
-#             success, failed = await retry_async_bulk(es_client, actions, worker_id)
-#             batch_time = time.time() - batch_start_time
-#             print(f"Worker {worker_id}: Indexed batch at offset {offset} in {batch_time:.2f} seconds")
-#             print(f"Worker {worker_id}: Success: {success}, Failed: {failed}")
-
-#             total_docs_indexed += success
-#             offset += BATCH_SIZE * NUM_WORKERS
-#         except Exception as e:
-#             print(f"------ Worker {worker_id}: Encountered error at offset {offset} - {str(e)} ---------")
-#             # Optionally, you could add a short delay here to prevent rapid retries
-#             await asyncio.sleep(1)
-#             break
-
-#     worker_total_time = time.time() - worker_start_time
-#     print(f"Worker {worker_id}: Total documents indexed = {total_docs_indexed}, Total time = {worker_total_time:.2f} seconds")
-
-# async def fill_index_task(index_name):
-#     es_client = get_elasticsearch_async()
-#     db = get_database()
-
-#     # Launch 10 concurrent workers
-#     tasks = [worker(worker_id, db, es_client, index_name) for worker_id in range(NUM_WORKERS)]
-#     await asyncio.gather(*tasks)
-
-#     print("Indexing complete.")
\ No newline at end of file
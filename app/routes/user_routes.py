@@ -4,35 +4,41 @@ from sqlalchemy import insert, select
 from databases import Database
 from datetime import datetime, timedelta
 import jwt
-import bcrypt
 
 from pymysql.err import IntegrityError, MySQLError
 
 from ..schemas import UserCreate, UserLogin
 from ..models import model_user
-from ..config import get_database
-from ..env import SECRET_KEY, ALGORITHM
+from ..config import get_database, get_redis
+from ..users import load_user
+from ..passwords import password_hasher, PasswordHasherBusy
+from ..env import SECRET_KEY, ALGORITHM, ADMIN_EMAILS
 
 
 router = APIRouter()
 
+def hasher_busy():
+    return HTTPException(status_code=503, detail="Too many login attempts in progress, try again shortly", headers={"Retry-After": "1"})
+
 @router.post("/register")
 async def register_user(user: UserCreate, database: Database = Depends(get_database)):
     try:
 
-        hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = await password_hasher.hash(user.password)
         
         query = insert(model_user).values(
             email=user.email,
             first_name=user.first_name,
             last_name=user.last_name,
-            password=hashed_password.decode('utf-8'),
+            password=hashed_password,
             allow_downloads=False  # Set to False by default
         )
         
         await database.execute(query)
         return {"message": "User registered successfully"}
     
+    except PasswordHasherBusy:
+        raise hasher_busy()
     except IntegrityError:
         raise HTTPException(status_code=400, detail=f"Email already registered: {user.email}")
     
@@ -43,8 +49,8 @@ async def register_user(user: UserCreate, database: Database = Depends(get_datab
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
-def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
 @router.post("/login")
@@ -56,7 +62,7 @@ async def login(user: UserLogin, database: Database = Depends(get_database)):
         if not result:
             raise HTTPException(status_code=400, detail="Incorrect email")
         
-        if not verify_password(user.password, result['password']):
+        if not await verify_password(user.password, result['password']):
             raise HTTPException(status_code=400, detail="Incorrect password")
         
         access_token = create_access_token(data={"sub": result['email']}, expires_delta=timedelta(days=3))
@@ -65,6 +71,8 @@ async def login(user: UserLogin, database: Database = Depends(get_database)):
     
     except HTTPException as http_exc:
         raise http_exc
+    except PasswordHasherBusy:
+        raise hasher_busy()
     except MySQLError as db_error:
         raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
     except Exception as e:
@@ -81,7 +89,7 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(request: Request, database: Database = Depends(get_database)):
+async def get_current_user(request: Request, database: Database = Depends(get_database), redis_client=Depends(get_redis)):
     try:
         token = request.headers.get("Authorization")
         if token is None:
@@ -94,8 +102,8 @@ async def get_current_user(request: Request, database: Database = Depends(get_da
         if email is None:
             raise HTTPException(status_code=403)
     
-        query = select(model_user).where(model_user.c.email == email)
-        user = await database.fetch_one(query)
+        # Cached for USER_CACHE_TTL, permission changes go through users.set_allow_downloads
+        user = await load_user(database, redis_client, email)
         
         if user is None or not user['allow_downloads']:
             raise HTTPException(status_code=403, detail="You don't have enough permissions. Check FAQ!")
@@ -111,3 +119,8 @@ async def get_current_user(request: Request, database: Database = Depends(get_da
         raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+async def get_admin_user(user: dict = Depends(get_current_user)):
+    if user["email"].lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
@@ -51,4 +51,6 @@ class QueryParams(BaseModel):
     permissions: Optional[str] = Field(None, max_length=200, pattern=r"^[a-zA-Z0-9\s,]*$")
     downloadable: Optional[bool] = True
     page: int = Field(1, ge=1, le=5000)
+    cursor: Optional[str] = Field(None, max_length=4096, pattern=r"^(\*|[A-Za-z0-9_\-=]+)$")
+    facets: bool = False
     limit: int = Field(10, ge=10, le=100)
\ No newline at end of file
@@ -0,0 +1,393 @@
+# search.py
+import asyncio
+import base64
+import json
+
+from .env import ES_MAPPING_VERSION
+from .index_mapping import NGRAM_SIZE
+from .reference_data import reference_data
+
+# Mapping version of the index being searched, read from its _meta at startup and kept
+# current by keep_mapping_version, so the builder only uses fields the live index has.
+# Until it is known, assume the oldest mapping: its fields exist on every index.
+# ES_MAPPING_VERSION pins it instead.
+OLDEST_MAPPING_VERSION = 1
+MAPPING_VERSION_CHECK_INTERVAL = 60  # seconds, picks up alias swaps and rollbacks
+SEARCH_MAPPING_VERSION = int(ES_MAPPING_VERSION) if ES_MAPPING_VERSION else OLDEST_MAPPING_VERSION
+
+
+async def detect_mapping_version(es_client, index: str) -> int:
+    """
+    Mapping version of the index (or every index behind the alias) being searched.
+    """
+    global SEARCH_MAPPING_VERSION
+    if ES_MAPPING_VERSION:
+        return SEARCH_MAPPING_VERSION
+    mappings = await es_client.indices.get_mapping(index=index)
+    # Mid swap an alias can point at two indices, only use fields both of them have
+    versions = [
+        mapping["mappings"].get("_meta", {}).get("mapping_version", OLDEST_MAPPING_VERSION)
+        for mapping in mappings.values()
+    ]
+    version = min(versions, default=OLDEST_MAPPING_VERSION)
+    if version != SEARCH_MAPPING_VERSION:
+        print(f"Searching {index} with mapping v{version}")
+    SEARCH_MAPPING_VERSION = version
+    return version
+
+
+async def keep_mapping_version(get_es_client, index: str, interval: float = MAPPING_VERSION_CHECK_INTERVAL):
+    """
+    Background task: re-read the mapping version periodically, keeping the last known one on errors.
+    """
+    while True:
+        try:
+            await detect_mapping_version(get_es_client(), index)
+        except Exception as e:
+            print(f"Mapping version check failed: {e}")
+        await asyncio.sleep(interval)
+
+SEARCH_SOURCE_FIELDS = ["app_id", "package_name", "latest_name"]
+
+
+def search_source_fields() -> list:
+    """
+    Fields projected by search hits. Indices from before mapping v2 may lack latest_name,
+    their names history is fetched too so hit_name can fall back to it.
+    """
+    if SEARCH_MAPPING_VERSION < 2:
+        return SEARCH_SOURCE_FIELDS + ["names"]
+    return SEARCH_SOURCE_FIELDS
+
+
+def latest_name(names: list) -> str:
+    """
+    Name with the most recent created_on. Stored on the document at index time
+    so search never has to fetch and scan the full names history.
+    """
+    latest_name_entry = max(names, key=lambda x: x["created_on"] or "", default={})
+    return latest_name_entry.get("name", "")
+
+
+def hit_name(source: dict) -> str:
+    if "latest_name" in source:
+        return source["latest_name"]
+    return latest_name(source.get("names", []))
+
+
+def suggest_input(name: str, package_name: str, num_versions: int) -> dict:
+    """
+    Completion input of a document. Apps with more archived versions rank first.
+    """
+    return {
+        "input": [value for value in (name, package_name) if value],
+        "weight": max(num_versions, 1)
+    }
+
+
+def substring_query(field: str, value: str) -> dict:
+    """
+    Case-insensitive substring match on a field. Uses the trigram subfield when the
+    index mapping has one and the value is long enough to produce grams, otherwise
+    falls back to a wildcard on the raw keyword.
+    """
+    if SEARCH_MAPPING_VERSION >= 2 and len(value) >= NGRAM_SIZE:
+        return {"match_phrase": {f"{field}.ngram": value}}
+    return {
+        "wildcard": {
+            f"{field}.raw": {
+                "value": f"*{value}*",
+                "case_insensitive": True
+            }
+        }
+    }
+
+
+def downloadable_filter() -> dict:
+    """
+    Apps with at least one version.
+    """
+    return {
+        "nested": {
+            "path": "versions",
+            "query": {"exists": {"field": "versions"}}
+        }
+    }
+
+
+def build_search_query(params: dict, downloadable: bool = True) -> dict:
+    """
+    Build the Elasticsearch bool query for normalized search params. With downloadable=False
+    the downloadable filter is left out, for callers applying it as a post_filter.
+    """
+    # Combine categories and maturity terms, spelled as stored since the categories field is a keyword
+    category_maturity_terms = []
+    if params["categories"]:
+        category_maturity_terms += params["categories"].split(",")
+    if params["maturity"]:
+        category_maturity_terms += params["maturity"].split(",")
+    category_maturity_terms = [reference_data.canonical_category(term) for term in category_maturity_terms]
+
+    # Construct the Elasticsearch query
+    es_query = {"bool": {"must": [], "should": [], "filter": []}}
+
+    # Keyword search across multiple fields (OR logic internally)
+    if params["keyword"]:
+        es_query["bool"]["should"].extend([
+            # Search in names
+            {
+                "nested": {
+                    "path": "names",
+                    "query": {
+                        "match": {
+                            "names.name": {
+                                "query": params["keyword"],
+                                "operator": "AND",
+                                "fuzziness": "AUTO"
+                            }
+                        }
+                    }
+                }
+            },
+            # Search in descriptions
+            {
+                "nested": {
+                    "path": "descriptions",
+                    "query": {
+                        "match": {
+                            "descriptions.description": {
+                                "query": params["keyword"],
+                                "operator": "AND",
+                                "fuzziness": "AUTO"
+                            }
+                        }
+                    }
+                }
+            },
+            # Substring search in package_name
+            substring_query("package_name", params["keyword"]),
+            # Search in developer_name for partial matches
+            {
+                "match": {
+                    "developer_name": {
+                        "query": params["keyword"],
+                        "operator": "AND",
+                        "fuzziness": "AUTO"
+                    }
+                }
+            },
+            # Search in categories for exact matches
+            {
+                "term": {
+                    "categories": {
+                        "value": params["keyword"]
+                    }
+                }
+            },
+            # Substring search in versions.permissions
+            {
+                "nested": {
+                    "path": "versions",
+                    "query": substring_query("versions.permissions", params["keyword"])
+                }
+            }
+        ])
+        es_query["bool"]["minimum_should_match"] = 1  # At least one of the should clauses must match
+
+    if params["query"]:
+        es_query["bool"]["must"].append({
+            "nested": {
+                "path": "names",
+                "query": {
+                    "match": {
+                        "names.name": {
+                            "query": params["query"],
+                            "operator": "AND",
+                            "fuzziness": "AUTO"
+                        }
+                    }
+                }
+            }
+        })
+
+
+    if params.get("package_name"):
+        es_query["bool"]["must"].append(substring_query("package_name", params["package_name"]))
+    
+    if params["developer_name"]:
+        es_query["bool"]["must"].append({
+            "match_phrase": {
+                "developer_name": params["developer_name"]
+            }
+        })
+    
+    if category_maturity_terms:
+        # Ensure all specified categories/maturity terms match exactly
+        es_query["bool"]["must"].append({
+            "terms_set": {
+                "categories": {
+                    "terms": category_maturity_terms,
+                    "minimum_should_match_script": {
+                        "source": "params.num_terms"
+                    }
+                }
+            }
+        })
+
+    if params["permissions"]:
+        permissions_terms = params["permissions"].split(",")
+        es_query["bool"]["must"].append({
+            "nested": {
+                "path": "versions",
+                "query": {
+                    "bool": {
+                        "must": [
+                            substring_query("versions.permissions", perm.strip())
+                            for perm in permissions_terms
+                        ]
+                    }
+                }
+            }
+        })
+
+    # Check if the app is downloadable (has at least one version)
+    if params["downloadable"] and downloadable:
+        es_query["bool"]["filter"].append(downloadable_filter())
+
+    return es_query
+
+
+# Facets, computed by aggregations in the same request as the hits
+CATEGORY_FACET_SIZE = 100
+PERMISSION_FACET_SIZE = 20
+
+
+def facet_aggregations(downloadable: bool) -> dict:
+    """
+    Aggregations for the facet counts of a search. Category and maturity share the
+    categories field and are told apart by the registry's maturity levels; permissions
+    are counted per app, not per version, through reverse_nested. Aggregations ignore
+    the post_filter, so with downloadable set the value facets are filtered explicitly
+    to count the same apps as the hits.
+    """
+    value_aggs = {
+        "categories": {"terms": {"field": "categories", "size": CATEGORY_FACET_SIZE, "exclude": reference_data.maturity}},
+        "maturity": {"terms": {"field": "categories", "size": len(reference_data.maturity), "include": reference_data.maturity}},
+        "permissions": {
+            "nested": {"path": "versions"},
+            "aggs": {
+                "top": {
+                    "terms": {"field": "versions.permissions.raw", "size": PERMISSION_FACET_SIZE},
+                    "aggs": {"apps": {"reverse_nested": {}}}
+                }
+            }
+        }
+    }
+    aggs = {"filtered": {"filter": downloadable_filter(), "aggs": value_aggs}} if downloadable else value_aggs
+    # Not narrowed by the downloadable param, so both of its values are counted
+    aggs["downloadable"] = {
+        "filters": {
+            "filters": {
+                "true": downloadable_filter(),
+                "false": {"bool": {"must_not": [downloadable_filter()]}}
+            }
+        }
+    }
+    return aggs
+
+
+def parse_facets(aggregations: dict) -> dict:
+    values = aggregations.get("filtered", aggregations)
+    return {
+        "categories": [{"value": bucket["key"], "count": bucket["doc_count"]} for bucket in values["categories"]["buckets"]],
+        "maturity": [{"value": bucket["key"], "count": bucket["doc_count"]} for bucket in values["maturity"]["buckets"]],
+        "permissions": [
+            {"value": bucket["key"], "count": bucket["apps"]["doc_count"]}
+            for bucket in values["permissions"]["top"]["buckets"]
+        ],
+        "downloadable": {key: bucket["doc_count"] for key, bucket in aggregations["downloadable"]["buckets"].items()}
+    }
+
+
+def faceted_search_body(params: dict) -> dict:
+    """
+    Query, post_filter and aggregations for a search returning facets. The downloadable
+    filter moves to post_filter so its facet counts both values while hits stay filtered.
+    """
+    body = {"query": build_search_query(params, downloadable=False), "aggs": facet_aggregations(params["downloadable"])}
+    if params["downloadable"]:
+        body["post_filter"] = downloadable_filter()
+    return body
+
+
+# Autocomplete
+SUGGEST_NAME = "apps"
+
+
+def suggest_body(prefix: str, size: int) -> dict:
+    """
+    Completion suggester request, or an anchored prefix query on package names
+    for indices built before the suggest field existed (mapping v2 and older).
+    """
+    if SEARCH_MAPPING_VERSION >= 3:
+        return {
+            "size": 0,
+            "_source": search_source_fields(),
+            "suggest": {
+                SUGGEST_NAME: {
+                    "prefix": prefix,
+                    "completion": {"field": "suggest", "size": size, "skip_duplicates": True}
+                }
+            }
+        }
+    return {
+        "size": size,
+        "_source": search_source_fields(),
+        "query": {"prefix": {"package_name.raw": {"value": prefix, "case_insensitive": True}}}
+    }
+
+
+def parse_suggestions(es_response: dict) -> list:
+    if "suggest" in es_response:
+        documents = [option["_source"] for option in es_response["suggest"][SUGGEST_NAME][0]["options"]]
+    else:
+        documents = [hit["_source"] for hit in es_response["hits"]["hits"]]
+    return [
+        {
+            "app_id": source.get("app_id"),
+            "name": hit_name(source),
+            "package_name": source.get("package_name")
+        }
+        for source in documents
+    ]
+
+
+# Cursor pagination (point-in-time + search_after)
+FIRST_CURSOR = "*"
+PIT_KEEP_ALIVE = "5m"
+CURSOR_SORT = [{"_score": "desc"}, {"_shard_doc": "asc"}]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(pit_id: str, search_after: list, position: int, total_count: int, fingerprint: str) -> str:
+    payload = {"pit": pit_id, "sa": search_after, "n": position, "t": total_count, "q": fingerprint}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> dict:
+    """
+    Decode an opaque cursor token, checking it belongs to the same search.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        pit_id, search_after = payload["pit"], payload["sa"]
+        position, total_count = int(payload["n"]), int(payload["t"])
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+    if payload.get("q") != fingerprint:
+        raise InvalidCursor("Cursor does not belong to this search")
+    return {"pit": pit_id, "search_after": search_after, "position": position, "total_count": total_count}
@@ -0,0 +1,238 @@
+# summary.py
+# Maintains app_summary, the denormalized read model behind /details.
+#
+#   python -m app.summary --rebuild      full rebuild, keyset paginated over model_app.id
+#   python -m app.summary --refresh      refresh apps whose names/descriptions changed since the last run
+#
+# --rebuild and --refresh keep per source watermarks in .summary-watermarks.json; refreshing
+# individual apps (--apps, sync --summaries) leaves them alone.
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from .config import get_database, connect, disconnect, engine
+from .models import model_app, model_developer, model_name, model_description, model_category
+from .models import model_category_apps__model_app_categories, app_summary
+from .reference_data import MATURITY_LEVELS
+from .watermarks import Watermarks, source_key
+
+BATCH_SIZE = 1000
+# Rows created while a refresh was running may carry a created_on slightly before its start
+REFRESH_OVERLAP = timedelta(minutes=5)
+# (table, timestamp column) pairs whose new rows change an app's summary
+SOURCES = [
+    (model_name, "created_on"),
+    (model_description, "created_on"),
+]
+WATERMARKS_PATH = ".summary-watermarks.json"
+WATERMARKS_NAME = "app_summary"
+
+
+async def build_summaries(database, app_ids: list) -> list:
+    """
+    Summary rows for the given apps, built from keyed per-table queries.
+    """
+    if not app_ids:
+        return []
+
+    apps_query = (
+        select(model_app.c.id, model_app.c.app_id.label("package_name"), model_developer.c.developer_id)
+        .select_from(model_app.join(model_developer, model_app.c.developer_id == model_developer.c.id))
+        .where(model_app.c.id.in_(app_ids))
+    )
+    summaries = {
+        row["id"]: {
+            "app_id": row["id"],
+            "package_name": row["package_name"],
+            "developer_id": row["developer_id"],
+            "name": None,
+            "description_id": None,
+            "text": None,
+            "created_on": None,
+            "categories": [],
+            "maturity": [],
+        }
+        for row in await database.fetch_all(apps_query)
+    }
+    if not summaries:
+        return []
+    app_ids = list(summaries)
+
+    # Latest name per app
+    names_query = (
+        select(model_name.c.app_id, model_name.c.name)
+        .where(model_name.c.app_id.in_(app_ids))
+        .order_by(model_name.c.app_id, model_name.c.created_on, model_name.c.id)
+    )
+    for row in await database.fetch_all(names_query):
+        summaries[row["app_id"]]["name"] = row["name"]
+
+    # Latest description per app: pick ids first, then load only those texts
+    latest_description_ids = {}
+    description_ids_query = (
+        select(model_description.c.id, model_description.c.app_id)
+        .where(model_description.c.app_id.in_(app_ids))
+        .order_by(model_description.c.app_id, model_description.c.created_on, model_description.c.id)
+    )
+    for row in await database.fetch_all(description_ids_query):
+        latest_description_ids[row["app_id"]] = row["id"]
+
+    if latest_description_ids:
+        descriptions_query = (
+            select(model_description.c.id, model_description.c.app_id, model_description.c.text, model_description.c.created_on)
+            .where(model_description.c.id.in_(list(latest_description_ids.values())))
+        )
+        for row in await database.fetch_all(descriptions_query):
+            summary = summaries[row["app_id"]]
+            summary["description_id"] = row["id"]
+            summary["text"] = row["text"]
+            summary["created_on"] = row["created_on"]
+
+    mca = model_category_apps__model_app_categories
+    categories_query = (
+        select(mca.c.model_app_id, model_category.c.name)
+        .select_from(mca.join(model_category, mca.c.model_category_id == model_category.c.id))
+        .where(mca.c.model_app_id.in_(app_ids))
+        .distinct()
+    )
+    for row in await database.fetch_all(categories_query):
+        bucket = "maturity" if row["name"] in MATURITY_LEVELS else "categories"
+        summaries[row["model_app_id"]][bucket].append(row["name"])
+
+    refreshed_on = datetime.utcnow()
+    rows = []
+    for summary in summaries.values():
+        # /details only serves apps that have a description and a name
+        if summary["description_id"] is None or summary["name"] is None:
+            continue
+        summary["categories"] = ",".join(sorted(summary["categories"]))
+        summary["maturity"] = ",".join(sorted(summary["maturity"]))
+        summary["refreshed_on"] = refreshed_on
+        rows.append(summary)
+    return rows
+
+
+async def upsert_summaries(database, rows: list):
+    if not rows:
+        return
+    stmt = mysql_insert(app_summary).values(rows)
+    stmt = stmt.on_duplicate_key_update({
+        column.name: stmt.inserted[column.name]
+        for column in app_summary.columns
+        if column.name != "app_id"
+    })
+    await database.execute(stmt)
+
+
+async def refresh_summaries(database, app_ids: list) -> int:
+    """
+    Rebuild the summary rows of specific apps.
+    """
+    total = 0
+    for i in range(0, len(app_ids), BATCH_SIZE):
+        rows = await build_summaries(database, app_ids[i:i + BATCH_SIZE])
+        await upsert_summaries(database, rows)
+        total += len(rows)
+    return total
+
+
+async def rebuild_all(database) -> int:
+    """
+    Full rebuild, paginating model_app by primary key.
+    """
+    last_id = 0
+    total = 0
+    start_time = time.time()
+    while True:
+        ids_query = select(model_app.c.id).where(model_app.c.id > last_id).order_by(model_app.c.id).limit(BATCH_SIZE)
+        app_ids = [row["id"] for row in await database.fetch_all(ids_query)]
+        if not app_ids:
+            break
+        rows = await build_summaries(database, app_ids)
+        await upsert_summaries(database, rows)
+        total += len(rows)
+        last_id = app_ids[-1]
+        print(f"app_summary: {total} rows up to app {last_id} ({total / (time.time() - start_time):.0f} rows/sec)")
+    return total
+
+
+async def source_watermarks(database) -> dict:
+    """
+    Newest created_on of every source, read from the source tables themselves.
+    """
+    uppers = {}
+    for table, column_name in SOURCES:
+        upper = await database.fetch_val(select(func.max(table.c[column_name])))
+        if upper is not None:
+            uppers[source_key(table, column_name)] = upper
+    return uppers
+
+
+async def rebuild_with_watermarks(database, watermarks) -> int:
+    # Taken before the rebuild, rows created while it runs are picked up by the next refresh
+    uppers = await source_watermarks(database)
+    total = await rebuild_all(database)
+    watermarks.values.update(uppers)
+    watermarks.save()
+    return total
+
+
+async def refresh_changed(database, watermarks) -> int:
+    """
+    Incremental refresh: apps with a name or description created since the source watermarks.
+    Falls back to a full rebuild when there are no watermarks yet.
+    """
+    if any(source_key(table, column) not in watermarks.values for table, column in SOURCES):
+        return await rebuild_with_watermarks(database, watermarks)
+
+    uppers = await source_watermarks(database)
+    changed = set()
+    for table, column_name in SOURCES:
+        key = source_key(table, column_name)
+        column = table.c[column_name]
+        since = watermarks.values[key]
+        upper = uppers.get(key)
+        if upper is None or upper < since:
+            continue
+        query = select(table.c.app_id).where(column >= since - REFRESH_OVERLAP, column <= upper).distinct()
+        changed.update(row["app_id"] for row in await database.fetch_all(query))
+
+    total = await refresh_summaries(database, sorted(changed))
+    # Only advance once every changed app has been written
+    watermarks.values.update(uppers)
+    watermarks.save()
+    print(f"app_summary: refreshed {total} changed apps")
+    return total
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Maintain the app_summary read model")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--rebuild", action="store_true", help="rebuild every app")
+    mode.add_argument("--refresh", action="store_true", help="refresh apps changed since the last run")
+    mode.add_argument("--apps", type=lambda ids: [int(i) for i in ids.split(",")], help="comma separated app ids to refresh")
+    args = parser.parse_args()
+
+    watermarks = Watermarks(WATERMARKS_PATH, WATERMARKS_NAME)
+    watermarks.load()
+
+    app_summary.create(engine, checkfirst=True)
+    await connect()
+    try:
+        database = get_database()
+        if args.rebuild:
+            await rebuild_with_watermarks(database, watermarks)
+        elif args.refresh:
+            await refresh_changed(database, watermarks)
+        else:
+            await refresh_summaries(database, args.apps)
+    finally:
+        await disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+# sync.py
+# Incremental MySQL -> Elasticsearch sync. Tracks a watermark per source timestamp
+# column and reindexes only the apps touched since the last run:
+#
+#   python -m app.sync --index apps-v2                  # one pass (cron)
+#   python -m app.sync --index apps-v2 --interval 60    # run continuously
+#   python -m app.sync --index apps-v2 --since 2024-11-01T00:00:00
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from .config import connect, disconnect, connect_elastic, close_elastic, get_database, get_elasticsearch_async
+from .models import model_download, model_name, model_description
+from .indexer import index_apps, BATCH_SIZE
+from .summary import refresh_summaries
+from .watermarks import Watermarks, source_key
+
+# (table, timestamp column) pairs whose changes affect an app's search document
+SOURCES = [
+    (model_download, "created_on"),
+    (model_download, "modified_on"),
+    (model_name, "created_on"),
+    (model_description, "created_on"),
+]
+# Re-read a small window behind each watermark: rows committed late with an older
+# timestamp are picked up, reindexing an app twice is harmless
+WATERMARK_OVERLAP = timedelta(minutes=2)
+
+
+async def changed_apps(database, watermarks: Watermarks, default_since: datetime):
+    """
+    App ids changed in any source since its watermark, and the new watermark values.
+    """
+    app_ids = set()
+    new_values = {}
+    for table, column_name in SOURCES:
+        key = source_key(table, column_name)
+        column = table.c[column_name]
+        since = watermarks.values.get(key, default_since)
+
+        upper = await database.fetch_val(select(func.max(column)))
+        if upper is None or upper < since:
+            # Nothing new, but persist the starting point so the next run does not default again
+            new_values[key] = since
+            continue
+        query = (
+            select(table.c.app_id)
+            .where(column >= since - WATERMARK_OVERLAP, column <= upper)
+            .distinct()
+        )
+        app_ids.update(row["app_id"] for row in await database.fetch_all(query))
+        new_values[key] = upper
+    return sorted(app_ids), new_values
+
+
+async def sync_once(database, es_client, index_name: str, watermarks: Watermarks, default_since: datetime, summaries=False):
+    start_time = time.time()
+    app_ids, new_values = await changed_apps(database, watermarks, default_since)
+
+    indexed = failed = 0
+    for i in range(0, len(app_ids), BATCH_SIZE):
+        success, errors = await index_apps(database, es_client, index_name, app_ids[i:i + BATCH_SIZE])
+        indexed += success
+        failed += errors
+    if summaries and app_ids:
+        await refresh_summaries(database, app_ids)
+
+    elapsed = time.time() - start_time
+    print(f"Sync {index_name}: {len(app_ids)} changed apps, {indexed} indexed, {failed} failed in {elapsed:.2f}s")
+
+    # Only advance once every changed app has been written, otherwise the next pass retries them all
+    if failed:
+        print(f"Sync {index_name}: {failed} documents failed, watermarks not advanced")
+        return indexed
+    watermarks.values.update(new_values)
+    watermarks.save()
+    return indexed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Incrementally sync changed apps into an Elasticsearch index")
+    parser.add_argument("--index", required=True, help="index to update")
+    parser.add_argument("--state", help="watermark file (default .sync-<index>.json)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="start point for sources without a watermark (default: now)")
+    parser.add_argument("--interval", type=float, help="keep running, syncing every N seconds")
+    parser.add_argument("--summaries", action="store_true", help="also refresh app_summary rows of changed apps")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    watermarks = Watermarks(args.state or f".sync-{args.index}.json", args.index)
+    watermarks.load()
+    default_since = args.since or datetime.utcnow()
+
+    await connect()
+    await connect_elastic()
+    try:
+        database = get_database()
+        es_client = get_elasticsearch_async()
+        while True:
+            if not args.interval:
+                await sync_once(database, es_client, args.index, watermarks, default_since, args.summaries)
+                break
+            try:
+                await sync_once(database, es_client, args.index, watermarks, default_since, args.summaries)
+            except Exception as e:
+                # Transient MySQL/ES errors must not stop the daemon, the watermarks were not advanced
+                print(f"Sync {args.index} failed, retrying in {args.interval}s: {e}")
+            await asyncio.sleep(args.interval)
+    finally:
+        await disconnect()
+        await close_elastic()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
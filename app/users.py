@@ -0,0 +1,94 @@
+# users.py
+# Short-TTL cache of user permission lookups, keyed by email and shared by all workers
+# through Redis, so authenticated requests skip the users query. Changing allow_downloads
+# must go through set_allow_downloads (or invalidate_user) to drop the cached entry:
+#
+#   python -m app.users --grant someone@example.com
+#   python -m app.users --revoke someone@example.com
+import argparse
+import asyncio
+
+import orjson
+from sqlalchemy import select, update
+
+from .config import connect, disconnect, init_redis, close_redis, get_database, get_redis
+from .models import model_user
+from .env import USER_CACHE_TTL
+
+# Never cached: the password hash stays in MySQL
+USER_CACHE_FIELDS = ["email", "first_name", "last_name", "allow_downloads"]
+
+
+def user_cache_key(email: str) -> str:
+    return f"user:{email.lower()}"
+
+
+async def fetch_user(database, email: str):
+    query = select(*[model_user.c[field] for field in USER_CACHE_FIELDS]).where(model_user.c.email == email)
+    row = await database.fetch_one(query)
+    return dict(row) if row else None
+
+
+async def load_user(database, redis_client, email: str):
+    """
+    User fields for an email, from Redis when cached. Redis errors fall back to MySQL.
+    """
+    cache_key = user_cache_key(email)
+    try:
+        cached_user = await redis_client.get(cache_key)
+        if cached_user:
+            return orjson.loads(cached_user)
+    except Exception as e:
+        print(f"User cache read failed: {e}")
+
+    user = await fetch_user(database, email)
+    if user is not None:
+        user["allow_downloads"] = bool(user["allow_downloads"])
+        try:
+            await redis_client.set(cache_key, orjson.dumps(user), ex=USER_CACHE_TTL)
+        except Exception as e:
+            print(f"User cache write failed: {e}")
+    return user
+
+
+async def invalidate_user(redis_client, email: str):
+    await redis_client.delete(user_cache_key(email))
+
+
+async def set_allow_downloads(database, redis_client, email: str, allowed: bool) -> bool:
+    """
+    Grant or revoke downloads and drop the cached permissions. False when the user does not exist.
+    """
+    if await fetch_user(database, email) is None:
+        return False
+    query = update(model_user).where(model_user.c.email == email).values(allow_downloads=allowed)
+    await database.execute(query)
+    await invalidate_user(redis_client, email)
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Grant or revoke APK downloads for a user")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--grant", metavar="EMAIL", help="allow downloads")
+    mode.add_argument("--revoke", metavar="EMAIL", help="disallow downloads")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    email = args.grant or args.revoke
+    await connect()
+    await init_redis()
+    try:
+        if await set_allow_downloads(get_database(), get_redis(), email, bool(args.grant)):
+            print(f"Downloads {'granted to' if args.grant else 'revoked for'} {email}")
+        else:
+            print(f"No user {email}")
+    finally:
+        await disconnect()
+        await close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+# watermarks.py
+# Persisted per source timestamp column progress of incremental jobs (sync, summary),
+# stored as JSON next to the job and tied to the index or table it tracks.
+import json
+import os
+from datetime import datetime
+
+
+class Watermarks:
+    def __init__(self, path: str, index_name: str):
+        self.path = path
+        self.index_name = index_name
+        self.values = {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get("index") != self.index_name:
+            raise ValueError(f"Watermarks {self.path} belong to index {state.get('index')}")
+        self.values = {key: datetime.fromisoformat(value) for key, value in state["watermarks"].items()}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "index": self.index_name,
+                "watermarks": {key: value.isoformat() for key, value in self.values.items()}
+            }, f)
+        os.replace(tmp_path, self.path)
+
+
+def source_key(table, column: str) -> str:
+    return f"{table.name}.{column}"